@@ -1,6 +1,9 @@
-import os
+from typing import Mapping
 
-from flask import Flask, jsonify
+import click
+
+from flask import Flask, current_app, jsonify
+from flask.cli import with_appcontext
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
 from flask_uploads import configure_uploads, patch_request_class
@@ -9,46 +12,164 @@ from marshmallow import ValidationError
 
 from libs.ma import ma
 from libs.db import db
-from libs.bc import bc
-from libs.im import IMAGE_SET
-from libs.i18n import change_locale
+from libs.sqlite import sqlite_profile
+from libs.bc import bc, hasher
+from libs.im import IMAGE_SET, UploadRequest, get_folder
+from libs.variants import variants
+from libs.cache import cache
+from libs.metrics import metrics
+from libs.profiler import profiler
+from libs.export import EXPORT_FORMATS, export_rows, gzip_chunks
+from libs.fastjson import output_json
+from libs import i18n
+from libs.schema import upgrade_schema
 from blacklist import BLACKLIST
+from models.activation import ActivationModel, reaper
+from models.outbox import OutboxModel, dispatcher
+from models.image import ImageModel
+from models.user import UserModel
 from resources.user import UserRegister, UserLogin, User, TokenRefresh, UserLogout
-from resources.item import Item, ItemList
+from resources.item import Item, ItemList, ItemBulk
 from resources.store import Store, StoreList
 from resources.activation import Activation, ActivationByUser
-from resources.image import ImageUpload, Image, AvatarUpload, Avatar
+from resources.image import ImageUpload, ImageList, Image, AvatarUpload, Avatar, AVATAR_FOLDER
+from resources.export import Export, EXPORT_MODELS
 
 
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024
 
-change_locale("en-us")
-# change_locale("pt-br")
-
-app = Flask(__name__)
-load_dotenv(".env", verbose=True)
-app.config.from_object("default_config")
-app.config.from_envvar("APP_SETTINGS")
+jwt = JWTManager()
 
-patch_request_class(app, MAX_UPLOAD_SIZE)
-configure_uploads(app, IMAGE_SET)
 
-api = Api(app, prefix="/api/v1")
-jwt = JWTManager(app)
+def create_app(config: Mapping = None) -> Flask:
+    """
+    Takes settings overriding `default_config` and the `APP_SETTINGS` file, returns the app with every extension
+    initialized. Importing this module has no side effects, the work happens here once per process.
+    """
+    load_dotenv(".env", verbose=True)
+    app = Flask(__name__)
+    app.config.from_object("default_config")
+    app.config.from_envvar("APP_SETTINGS", silent=True)
+    if config:
+        app.config.update(config)
 
+    i18n.init_app(app)
 
-@app.before_first_request
-def create_tables():
+    app.request_class = UploadRequest
+    patch_request_class(app, MAX_UPLOAD_SIZE)
+    configure_uploads(app, IMAGE_SET)
+    sqlite_profile.init_app(app)
     db.init_app(app)
-    db.create_all()
+    ma.init_app(app)
+    bc.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
+    metrics.add_stats("model_cache", cache.stats)
+    profiler.init_app(app)
+    BLACKLIST.init_app(app)
+    hasher.init_app(app)
+    variants.init_app(app)
+    if app.config.get("EMAIL_OUTBOX_AUTOSTART", True):
+        dispatcher.init_app(app, app.config.get("EMAIL_OUTBOX_POLL_INTERVAL"))
+    if app.config.get("ACTIVATION_REAPER_AUTOSTART", True):
+        reaper.init_app(app, app.config.get("ACTIVATION_REAPER_INTERVAL"))
+
+    api = Api(app, prefix="/api/v1")
+    api.representation("application/json")(output_json)
+    add_resources(api)
+    jwt.init_app(app)
+
+    app.register_error_handler(ValidationError, handle_marshmallow_validation)
+    app.after_request(add_header)
+    app.before_first_request(start_background_tasks)
+    for command in (init_db, calibrate_bcrypt, send_emails, reap_activations, index_avatars, index_images, export):
+        app.cli.add_command(command)
+
+    if app.config.get("SCHEMA_UPGRADE_ON_START", False):
+        with app.app_context():
+            upgrade_schema()
+
+    return app
+
+
+def start_background_tasks():
+    # no-ops unless bound to the app, and never before the server forked its workers; the dispatcher also
+    # delivers what a previous run left pending or waiting on a retry, not only the next registration's email
+    reaper.wake()
+    dispatcher.wake()
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db():
+    """Creates the tables, columns and indexes missing from the database."""
+    changes = upgrade_schema()
+    for change in changes:
+        click.echo(change)
+    click.echo(f"{len(changes)} schema change(s) applied.")
+
+
+@click.command("calibrate-bcrypt")
+@with_appcontext
+def calibrate_bcrypt():
+    """Prints the highest bcrypt cost that fits BCRYPT_LATENCY_BUDGET_MS on this machine."""
+    config = current_app.config
+    budget = config.get("BCRYPT_LATENCY_BUDGET_MS", 250)
+    rounds = hasher.calibrate(budget, config.get("BCRYPT_MIN_LOG_ROUNDS", 10), config.get("BCRYPT_MAX_LOG_ROUNDS", 16))
+    click.echo(f"BCRYPT_LOG_ROUNDS = {rounds}  # hashes within {budget}ms here")
+
+
+@click.command("send-emails")
+@with_appcontext
+def send_emails():
+    """Delivers every due email in the outbox."""
+    click.echo(f"{OutboxModel.dispatch_due()} email(s) sent.")
+
+
+@click.command("reap-activations")
+@with_appcontext
+def reap_activations():
+    """Deletes activations that expired without being confirmed."""
+    click.echo(f"{ActivationModel.reap_expired()} expired activation(s) deleted.")
+
+
+@click.command("index-avatars")
+@with_appcontext
+def index_avatars():
+    """Records the avatar file of users who uploaded it before avatars were indexed."""
+    click.echo(f"{UserModel.index_avatars(get_folder(AVATAR_FOLDER))} avatar(s) indexed.")
+
+
+@click.command("index-images")
+@with_appcontext
+def index_images():
+    """Rebuilds the image metadata index from the files on disk."""
+    inserted, updated, deleted = ImageModel.reconcile(IMAGE_SET.config.destination)
+    click.echo(f"{inserted} image(s) indexed, {updated} updated, {deleted} removed.")
+
+
+@click.command("export")
+@click.argument("table", type=click.Choice(sorted(EXPORT_MODELS)))
+@click.option("--format", "fmt", type=click.Choice(EXPORT_FORMATS), default="ndjson", show_default=True)
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output on the fly.")
+@click.option("--after", type=int, default=None, help="Resume after this id.")
+@click.option("--output", "-o", default="-", help="Output file, defaults to stdout.")
+@with_appcontext
+def export(table, fmt, compress, after, output):
+    """Streams a whole table as CSV or NDJSON."""
+    chunks = export_rows(EXPORT_MODELS[table], fmt, after)
+    if compress:
+        chunks = gzip_chunks(chunks)
+
+    with click.open_file(output, "wb" if compress else "w") as file_object:
+        for chunk in chunks:
+            file_object.write(chunk)
 
 
-@app.errorhandler(ValidationError)
 def handle_marshmallow_validation(err):
     return jsonify(err.messages), 400
 
 
-@app.after_request
 def add_header(response):
     # just for the fun ;)
     response.headers['server'] = "obnoxious"
@@ -99,25 +220,26 @@ def revoked_token_callback(jwt_headers, jwt_payload):
     return (jsonify({"description": "The token has been revoked.", "error": "token_revoked"}), 401)
 
 
-api.add_resource(Store, "/store/<string:name>")
-api.add_resource(StoreList, "/stores")
-api.add_resource(Item, "/item/<string:name>")
-api.add_resource(ItemList, "/items")
-api.add_resource(UserRegister, "/register")
-api.add_resource(Activation, "/user_activate/<string:activation_id>")
-api.add_resource(ActivationByUser, "/activation/user/<int:user_id>")
-api.add_resource(User, "/user/<int:user_id>")
-api.add_resource(UserLogin, "/login")
-api.add_resource(TokenRefresh, "/refresh")
-api.add_resource(UserLogout, "/logout")
-api.add_resource(ImageUpload, "/upload/image")
-api.add_resource(Image, "/image/<string:filename>")
-api.add_resource(AvatarUpload, "/upload/avatar")
-api.add_resource(Avatar, "/avatar/<int:user_id>")
+def add_resources(api: Api) -> None:
+    api.add_resource(Store, "/store/<string:name>")
+    api.add_resource(StoreList, "/stores")
+    api.add_resource(Item, "/item/<string:name>")
+    api.add_resource(ItemList, "/items")
+    api.add_resource(ItemBulk, "/items/bulk")
+    api.add_resource(UserRegister, "/register")
+    api.add_resource(Activation, "/user_activate/<string:activation_id>")
+    api.add_resource(ActivationByUser, "/activation/user/<int:user_id>")
+    api.add_resource(User, "/user/<int:user_id>")
+    api.add_resource(UserLogin, "/login")
+    api.add_resource(TokenRefresh, "/refresh")
+    api.add_resource(UserLogout, "/logout")
+    api.add_resource(ImageUpload, "/upload/image")
+    api.add_resource(ImageList, "/images")
+    api.add_resource(Image, "/image/<string:filename>")
+    api.add_resource(AvatarUpload, "/upload/avatar")
+    api.add_resource(Avatar, "/avatar/<int:user_id>")
+    api.add_resource(Export, "/export/<string:table>")
 
-if __name__ == "__main__":
-    db.init_app(app)
-    ma.init_app(app)
-    bc.init_app(app)
 
-    app.run()
+if __name__ == "__main__":
+    create_app().run()
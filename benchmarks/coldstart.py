@@ -0,0 +1,168 @@
+"""
+benchmarks.coldstart
+
+Cold start of a worker, run from the project root:
+
+    python -m benchmarks.coldstart -n 20 -o coldstart.json
+    python -m benchmarks.coldstart --compare coldstart.json --importtime
+
+Every run is a fresh interpreter that imports `app`, calls `create_app()` and
+sends two requests through the test client, timing each step. The database is
+created once beforehand with the schema upgrade `flask init-db` runs, like a
+deployment does: no request pays for it.
+
+The report uses the same shape as `benchmarks.run` (p50/p95/p99 per step), so
+`--compare` gates on p95 in the same way. It also lists the heavy modules that
+must stay out of the import (`DEFERRED_MODULES`) but were loaded anyway, and with
+`--importtime` the slowest top-level imports.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Dict, List
+
+import click
+
+from benchmarks.environment import ROOT, load_app
+from benchmarks.run import compare, summarize
+from benchmarks.scenarios import API_PREFIX
+
+STEPS = ("import", "create_app", "first_request", "second_request", "process")
+# imported on first use only, a worker that never sends an email or reads an image size never loads them
+DEFERRED_MODULES = ("requests", "urllib3", "PIL.Image")
+
+PROBE = """
+import json, sys
+from time import perf_counter
+
+started = perf_counter()
+import app as module
+imported = perf_counter()
+app = module.create_app()
+created = perf_counter()
+client = app.test_client()
+status = client.get(sys.argv[1]).status_code
+first = perf_counter()
+client.get(sys.argv[1])
+second = perf_counter()
+
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": first - created,
+    "second_request": second - first,
+    "status": status,
+    "loaded": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+
+def probe(env: Dict[str, str], path: str) -> dict:
+    """Starts a fresh interpreter that boots the app, returns the seconds spent in each step"""
+    started = perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, path, *DEFERRED_MODULES], cwd=ROOT, env=env, check=True,
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process"] = perf_counter() - started
+    return timings
+
+
+def slowest_imports(env: Dict[str, str], count: int = 15) -> List[dict]:
+    """Returns the top-level imports of `app` that took the longest, cumulative milliseconds"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env, check=True,
+        stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # `app` itself and the modules it imports directly, deeper levels are indented further
+        if len(name) - len(name.lstrip(" ")) <= 3:
+            imports.append({"module": name.strip(), "cumulative_ms": round(int(parts[1]) / 1000, 1)})
+
+    return sorted(imports, key=lambda entry: entry["cumulative_ms"], reverse=True)[:count]
+
+
+@click.command()
+@click.option("--runs", "-n", default=10, show_default=True, help="Fresh interpreters started.")
+@click.option("--path", default=f"{API_PREFIX}/stores?limit=10", show_default=True, help="Requested twice per run.")
+@click.option("--importtime", is_flag=True, help="List the slowest imports of `app`.")
+@click.option("--output", "-o", default="-", help="Report file, defaults to stdout.")
+@click.option("--compare", "baseline", type=click.File("r"), default=None, help="Baseline report to compare with.")
+@click.option("--threshold", default=10.0, show_default=True, help="p95 growth (%) counted as a regression.")
+def main(runs, path, importtime, output, baseline, threshold):
+    """Times the import, create_app and first requests of fresh worker processes."""
+    if output != "-":
+        output = os.path.abspath(output)
+
+    workdir = tempfile.mkdtemp(prefix="rest-api-coldstart-")
+    try:
+        # the workers inherit the settings, and the schema exists before they start, as after `flask init-db`
+        app = load_app(workdir)
+        env = dict(os.environ)
+        with app.app_context():
+            from libs.db import db
+            from libs.schema import upgrade_schema
+
+            upgrade_schema()
+            db.get_engine(app).dispose()
+
+        click.echo(f"starting {runs} worker(s)", err=True)
+        samples = [probe(env, path) for _ in range(runs)]
+        statuses = sorted({sample["status"] for sample in samples})
+        loaded = sorted({name for sample in samples for name in sample["loaded"]})
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "runs": runs,
+                "path": path,
+                "statuses": statuses,
+            },
+            "results": {
+                "coldstart": {
+                    step: summarize([sample[step] for sample in samples], 0, 0) for step in STEPS
+                },
+            },
+            "deferred_modules_loaded": loaded,
+        }
+        if importtime:
+            report["slowest_imports"] = slowest_imports(env)
+        if baseline:
+            report["comparison"] = compare(report, json.load(baseline), threshold)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with click.open_file(output, "w") as file_object:
+        json.dump(report, file_object, indent=2)
+        file_object.write("\n")
+
+    failed = False
+    if statuses != [200]:
+        click.echo(f"FIRST REQUEST ANSWERED {statuses}", err=True)
+        failed = True
+    if loaded:
+        click.echo(f"DEFERRED MODULES LOADED AT STARTUP {', '.join(loaded)}", err=True)
+        failed = True
+    if baseline and report["comparison"]["regressions"]:
+        for regression in report["comparison"]["regressions"]:
+            click.echo(f"REGRESSION {regression}", err=True)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+benchmarks.concurrency
+
+Checks that reads keep going while other workers write, run from the project root:
+
+    python -m benchmarks.concurrency --duration 10
+    python -m benchmarks.concurrency --no-profile   # the same against a bare SQLite
+
+A seeded database is served by `--workers` pre-forked processes. Reader threads
+list items and stores in three phases: on their own, while writer threads insert
+items and upsert batches of them through the API, and while a connection holds
+an exclusive write transaction open for `--hold` seconds at a time. The model
+cache is off, every read reaches the database.
+
+The check fails (exit status 1) when a request failed, e.g. a 500 from a
+`database is locked`, or when no read completed while a write was in flight.
+Without WAL the readers wait for the exclusive transaction, so `--no-profile`
+is expected to fail the last phase. Latencies per phase are printed as JSON.
+
+`tests/test_sqlite_profile.py` checks a read during an exclusive transaction on
+every test run; this is the same check under load, from several processes.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from time import perf_counter, sleep
+from typing import Dict, List
+
+import click
+
+from benchmarks.environment import load_app, seed
+from benchmarks.run import _wait_until_up, start_server, summarize
+from benchmarks.scenarios import API_PREFIX, BenchContext
+
+BULK_ROWS = 200
+
+
+class Load:
+    """Requests sent by one phase: latencies per kind, failures and the reads that overlapped a write"""
+
+    def __init__(self):
+        self.latencies = {"read": [], "write": []}
+        self.errors = {"read": 0, "write": 0}
+        self.failures = []
+        self.writes_in_flight = 0
+        self.writes_started = 0
+        self.overlapped_reads = 0
+        self.lock = threading.Lock()
+
+    def record(self, kind: str, elapsed: float, failure: str = None, overlapped: bool = False) -> None:
+        with self.lock:
+            self.latencies[kind].append(elapsed)
+            if failure:
+                self.errors[kind] += 1
+                if len(self.failures) < 10:
+                    self.failures.append(failure)
+            self.overlapped_reads += overlapped
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            kind: summarize(self.latencies[kind], self.errors[kind], elapsed)
+            for kind in ("read", "write")
+            if self.latencies[kind] or self.errors[kind]
+        }
+
+
+def run_phase(base_url: str, ctx: BenchContext, readers: int, writers: int, duration: float, phase: str,
+              database: str = None, hold: float = None) -> dict:
+    """Runs reader and writer threads against the server for `duration` seconds, returns the summary of the phase
+
+    With `database` and `hold` the writer is a connection holding an exclusive transaction instead of API calls.
+    """
+    import requests
+
+    load = Load()
+    stop = threading.Event()
+    stores = max(ctx.volumes.get("stores", 1), 1)
+
+    def reader(number: int):
+        session = requests.Session()
+        i = number
+        while not stop.is_set():
+            path = "/items?limit=50" if i % 2 else f"/store/store{i % stores}"
+            # overlapped: the same writes were in flight from start to end, none started or ended meanwhile
+            during = (load.writes_in_flight, load.writes_started)
+            start = perf_counter()
+            failure = _send(session, "GET", base_url + API_PREFIX + path, 200, headers=ctx.auth)
+            elapsed = perf_counter() - start
+            overlapped = during[0] > 0 and during == (load.writes_in_flight, load.writes_started)
+            load.record("read", elapsed, failure, overlapped and not failure)
+            i += readers
+
+    def writer(number: int):
+        session = requests.Session()
+        i = 0
+        while not stop.is_set():
+            name = f"{ctx.tag}{phase}w{number}_{i}"
+            with load.lock:
+                load.writes_in_flight += 1
+                load.writes_started += 1
+            start = perf_counter()
+            if i % 2:
+                rows = [{"name": f"{name}_{row}", "price": 1.0 + row, "store_id": 1} for row in range(BULK_ROWS)]
+                failure = _send(session, "POST", f"{base_url}{API_PREFIX}/items/bulk?mode=upsert", 200,
+                                json=rows, headers=ctx.auth)
+            else:
+                failure = _send(session, "POST", f"{base_url}{API_PREFIX}/item/{name}", 201,
+                                json={"price": 9.99, "store_id": 1}, headers=ctx.auth)
+            elapsed = perf_counter() - start
+            with load.lock:
+                load.writes_in_flight -= 1
+            load.record("write", elapsed, failure)
+            i += 1
+
+    def holder():
+        connection = sqlite3.connect(database, timeout=30, isolation_level=None)
+        i = 0
+        while not stop.is_set():
+            start = perf_counter()
+            connection.execute("BEGIN EXCLUSIVE")
+            with load.lock:
+                load.writes_in_flight += 1
+                load.writes_started += 1
+            connection.execute("INSERT INTO stores (name) VALUES (?)", (f"{ctx.tag}{phase}h{i}",))
+            sleep(hold)
+            with load.lock:
+                load.writes_in_flight -= 1
+            connection.execute("COMMIT")
+            load.record("write", perf_counter() - start)
+            i += 1
+            # lets the readers that waited through
+            sleep(0.1)
+        connection.close()
+
+    threads = [threading.Thread(target=reader, args=(number,)) for number in range(readers)]
+    if hold:
+        threads.append(threading.Thread(target=holder))
+    else:
+        threads += [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    summary = load.summary(perf_counter() - started)
+    summary["overlapped_reads"] = load.overlapped_reads
+    summary["failures"] = load.failures
+    return summary
+
+
+def _send(session, method: str, url: str, expect: int, **kwargs) -> str:
+    """Returns None when the response has the expected status, else what went wrong"""
+    import requests
+
+    try:
+        response = session.request(method, url, timeout=30, **kwargs)
+    except requests.RequestException as err:
+        return f"{method} {url}: {err}"
+    if response.status_code != expect:
+        return f"{method} {url}: {response.status_code} {response.text[:200]}"
+    return None
+
+
+def check(report: Dict[str, dict], writers: int) -> List[str]:
+    """Takes the report of both phases, returns why the check failed (nothing when it passed)"""
+    problems = []
+    for phase, summary in report.items():
+        for kind in ("read", "write"):
+            errors = summary.get(kind, {}).get("errors", 0)
+            if errors:
+                problems.append(f"{phase}: {errors} failed {kind}(s), e.g. {summary['failures'][:1]}")
+
+    for phase in ("writes", "exclusive"):
+        during = report[phase]
+        if not during.get("read", {}).get("count"):
+            problems.append(f"{phase}: no read completed")
+        elif (writers or phase == "exclusive") and not during["overlapped_reads"]:
+            problems.append(f"{phase}: no read completed while a write was in flight")
+    return problems
+
+
+@click.command()
+@click.option("--duration", default=5.0, show_default=True, help="Seconds per phase.")
+@click.option("--readers", default=8, show_default=True, help="Reading client threads.")
+@click.option("--writers", default=4, show_default=True, help="Writing client threads.")
+@click.option("--workers", default=4, show_default=True, help="Server processes.")
+@click.option("--threaded/--no-threaded", default=True, show_default=True, help="Threads inside each server process.")
+@click.option("--hold", default=0.5, show_default=True, help="Seconds the exclusive transaction stays open.")
+@click.option("--items", default=5000, show_default=True)
+@click.option("--profile/--no-profile", default=True, show_default=True, help="SQLite production profile.")
+def main(duration, readers, writers, workers, threaded, hold, items, profile):
+    """Checks that reads keep going while other workers write."""
+    workdir = tempfile.mkdtemp(prefix="rest-api-concurrency-")
+    try:
+        app = load_app(workdir, BCRYPT_LOG_ROUNDS=4, MODEL_CACHE_ENABLED=False, SQLITE_PROFILE_ENABLED=profile)
+        volumes = {"users": 10, "stores": 50, "items": items, "activations": 10, "images": 0}
+        seed(app, **volumes)
+        ctx = BenchContext(app, "c", volumes)
+        database = os.path.join(workdir, "bench.db")
+
+        base_url, processes, listener = start_server(app, workers, threaded)
+        try:
+            _wait_until_up(base_url)
+            report = {
+                "reads": run_phase(base_url, ctx, readers, 0, duration, "r"),
+                "writes": run_phase(base_url, ctx, readers, writers, duration, "w"),
+                "exclusive": run_phase(base_url, ctx, readers, 0, duration, "x", database, hold),
+            }
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            listener.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    problems = check(report, writers)
+    click.echo(json.dumps({"profile": profile, "phases": report, "problems": problems}, indent=2))
+    if problems:
+        for problem in problems:
+            click.echo(f"FAILED {problem}", err=True)
+        sys.exit(1)
+    click.echo("reads kept going during writes", err=True)
+
+
+if __name__ == "__main__":
+    main()
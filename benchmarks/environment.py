@@ -0,0 +1,156 @@
+"""
+benchmarks.environment
+
+Builds a throwaway app for the benchmarks: a settings file pointing the database,
+uploads and variants into a temporary folder, then a seeded SQLite database.
+
+`create_app` reads the settings file named by `APP_SETTINGS`, `load_app` writes it
+and sets the variable first. Processes started afterwards inherit it.
+"""
+import importlib
+import io
+import os
+import sqlite3
+import struct
+import zlib
+from time import time
+from uuid import uuid4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USERNAME = "bench0"
+BENCH_PASSWORD = "benchmark"
+SEED_BATCH_SIZE = 1000
+
+
+def make_png(width: int = 64, height: int = 64) -> bytes:
+    """Returns a valid solid-color PNG, without needing Pillow"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\xc8\x0a\x0a" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def load_app(workdir: str, replica: bool = False, **overrides):
+    """Takes a scratch folder and config overrides, returns the app configured to use them
+
+    With `replica` GET requests read from a second SQLite file, filled by `snapshot_replica`.
+    """
+    settings = {
+        "DEBUG": False,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "SQLALCHEMY_BINDS": {"replica": f"sqlite:///{os.path.join(workdir, 'replica.db')}"} if replica else {},
+        "UPLOADED_IMAGES_DEST": os.path.join(workdir, "images"),
+        "IMAGE_VARIANT_FOLDER": os.path.join(workdir, "variants"),
+        "EMAIL_OUTBOX_AUTOSTART": False,
+        "ACTIVATION_REAPER_AUTOSTART": False,
+        **overrides,
+    }
+
+    settings_file = os.path.join(workdir, "bench_settings.py")
+    with open(settings_file, "w", encoding="utf-8") as file_object:
+        file_object.write("from default_config import *\n")
+        for key, value in settings.items():
+            file_object.write(f"{key} = {value!r}\n")
+
+    os.environ["APP_SETTINGS"] = settings_file
+    # registration only queues the email, the outbox is never dispatched here
+    os.environ.setdefault("MAILGUN_DOMAIN", "example.org")
+    os.environ.setdefault("MAILGUN_API_KEY", "benchmark")
+
+    # strings/ and .env are looked up relative to the project root
+    os.chdir(ROOT)
+    return importlib.import_module("app").create_app()
+
+
+def seed(app, users: int, stores: int, items: int, activations: int, images: int) -> None:
+    """Fills the database with the given volumes, the first user (`bench0`) can log in and owns the images"""
+    # imported late: some modules read the environment set up by `load_app` on import
+    from werkzeug.datastructures import FileStorage
+
+    from libs import im
+    from libs.bc import hasher
+    from libs.db import db
+    from libs.schema import upgrade_schema
+    from models.activation import ActivationModel
+    from models.image import ImageModel
+    from models.item import ItemModel
+    from models.store import StoreModel
+    from models.user import UserModel
+
+    with app.app_context():
+        upgrade_schema()
+
+        # hashing every password would time bcrypt, not the seeding
+        password = hasher.generate_password_hash(BENCH_PASSWORD)
+        _insert(UserModel, (
+            {"username": f"bench{i}", "email": f"bench{i}@example.org", "password": password, "activated": True}
+            for i in range(max(users, 1))
+        ))
+
+        # every user gets one activated activation, the rest are expired leftovers of re-sent emails
+        now = int(time())
+        user_count = max(users, 1)
+        _insert(ActivationModel, (
+            {
+                "id": uuid4().hex,
+                "user_id": i % user_count + 1,
+                "activated": i < user_count,
+                "expire_at": now + 1800 if i < user_count else now - 60,
+            }
+            for i in range(max(activations, user_count))
+        ))
+
+        _insert(StoreModel, ({"name": f"store{i}"} for i in range(max(stores, 1))))
+        store_count = max(stores, 1)
+        _insert(ItemModel, (
+            {"name": f"item{i}", "price": 10.0 + i % 100, "store_id": i % store_count + 1}
+            for i in range(items)
+        ))
+
+        png = make_png()
+        with app.test_request_context():
+            for i in range(images):
+                im.save_image(FileStorage(io.BytesIO(png), filename=f"seed{i}.png"), "user_1")
+            avatar = im.save_image(FileStorage(io.BytesIO(png), filename="avatar.png"), "avatars", "user_1.png")
+
+        if images:
+            ImageModel.reconcile(app.config["UPLOADED_IMAGES_DEST"])
+
+        UserModel.query.filter_by(id=1).update({"avatar": im.get_basename(avatar)})
+        db.session.commit()
+        db.session.remove()
+        # forked server workers must open their own connections
+        db.get_engine(app).dispose()
+
+
+def _insert(model: type, rows) -> None:
+    from libs.db import db
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= SEED_BATCH_SIZE:
+            db.session.bulk_insert_mappings(model, batch)
+            batch = []
+
+    db.session.bulk_insert_mappings(model, batch)
+    db.session.commit()
+
+
+def snapshot_replica(workdir: str) -> None:
+    """Copies the seeded database to the replica file, rows written afterwards only exist on the primary"""
+    # the backup API copies a consistent snapshot, WAL included
+    source = sqlite3.connect(os.path.join(workdir, "bench.db"))
+    target = sqlite3.connect(os.path.join(workdir, "replica.db"))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,320 @@
+"""
+benchmarks.run
+
+Load / latency benchmark of every API route, run from the project root:
+
+    python -m benchmarks.run --users 1000 --items 5000 -o baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+A throwaway SQLite database is seeded, then every scenario is driven through the
+Flask test client (the app alone, no network) and through a real pre-forked
+server (`--workers` processes accepting on one socket, like gunicorn's sync
+workers) hit by `--concurrency` client threads.
+
+The report is JSON: p50/p95/p99/mean latency in milliseconds and throughput per
+scenario and driver. With `--compare` every scenario is checked against a stored
+report and the command exits with status 1 when one got slower than `--threshold`.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from datetime import datetime, timezone
+from io import BytesIO
+from time import perf_counter, sleep
+from typing import Dict, List
+
+import click
+
+from benchmarks.environment import load_app, seed, snapshot_replica
+from benchmarks.scenarios import API_PREFIX, BenchContext, Call, Scenario, build_scenarios, uncovered_routes
+
+DRIVERS = ("client", "server")
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """Takes per-request latencies (seconds) and the wall time of the run, returns the report entry"""
+    ordered = sorted(latencies)
+
+    def percentile(rank: float) -> float:
+        # nearest rank
+        index = max(int(round(rank / 100 * len(ordered) + 0.5)) - 1, 0)
+        return round(ordered[min(index, len(ordered) - 1)] * 1000, 3)
+
+    if not ordered:
+        return {"count": 0, "errors": errors}
+
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_client(app, scenarios: List[Scenario], iterations: int, warmup: int) -> Dict[str, dict]:
+    """Drives the app in-process through the Flask test client, one request at a time"""
+    client = app.test_client()
+
+    def send(call: Call):
+        data = None
+        if call.upload:
+            data = {"image": (BytesIO(call.upload[1]), call.upload[0])}
+        response = client.open(call.path, method=call.method, json=call.json, data=data,
+                               headers=call.headers)
+        response.get_data()  # drains streamed bodies
+        return response.status_code
+
+    results = {}
+    for scenario in scenarios:
+        if scenario.setup:
+            scenario.setup()
+        if scenario.warm:
+            for i in range(warmup):
+                send(scenario.build(i))
+
+        latencies, errors = [], 0
+        started = perf_counter()
+        for i in range(iterations):
+            call = scenario.build(i)
+            start = perf_counter()
+            status = send(call)
+            latencies.append(perf_counter() - start)
+            errors += status != call.expect
+        results[scenario.name] = summarize(latencies, errors, perf_counter() - started)
+
+    return results
+
+
+def _serve(app, fd: int, threaded: bool) -> None:
+    from werkzeug.serving import make_server
+
+    def stop(signum, frame):
+        # the hashing / resizing pools would outlive a worker that is just killed
+        for child in multiprocessing.active_children():
+            child.terminate()
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    # the access log of every request would dominate the timings
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", 0, app, threaded=threaded, fd=fd).serve_forever()
+
+
+def start_server(app, workers: int, threaded: bool):
+    """Pre-forks `workers` processes sharing one listening socket, returns (base url, processes)"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)
+
+    context = multiprocessing.get_context("fork")
+    # not daemonic: the workers start their own hashing / resizing process pools
+    processes = [
+        context.Process(target=_serve, args=(app, listener.fileno(), threaded))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    return f"http://127.0.0.1:{listener.getsockname()[1]}", processes, listener
+
+
+def run_server(app, scenarios: List[Scenario], iterations: int, warmup: int, workers: int, concurrency: int,
+               threaded: bool) -> Dict[str, dict]:
+    """Drives a real multi-process server over HTTP from `concurrency` client threads"""
+    import requests
+
+    base_url, processes, listener = start_server(app, workers, threaded)
+    sessions = [requests.Session() for _ in range(concurrency)]
+
+    def send(session, call: Call):
+        files = {"image": call.upload} if call.upload else None
+        response = session.request(call.method, base_url + call.path, json=call.json, files=files,
+                                   headers=call.headers)
+        return response.status_code
+
+    try:
+        _wait_until_up(base_url)
+        results = {}
+        for scenario in scenarios:
+            if scenario.setup:
+                scenario.setup()
+            if scenario.warm:
+                for i in range(warmup):
+                    send(sessions[0], scenario.build(i))
+
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+
+            def worker(number: int):
+                local, failed = [], 0
+                for i in range(number, iterations, concurrency):
+                    call = scenario.build(i)
+                    start = perf_counter()
+                    try:
+                        status = send(sessions[number], call)
+                    except requests.RequestException:
+                        status = None
+                    local.append(perf_counter() - start)
+                    failed += status != call.expect
+                with lock:
+                    latencies.extend(local)
+                    errors[0] += failed
+
+            threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+            started = perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[scenario.name] = summarize(latencies, errors[0], perf_counter() - started)
+
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        listener.close()
+
+
+def _wait_until_up(base_url: str, timeout: float = 10) -> None:
+    import requests
+
+    waited = 0
+    while True:
+        try:
+            requests.get(f"{base_url}{API_PREFIX}/stores?limit=1", timeout=1)
+            return
+        except requests.ConnectionError:
+            if waited >= timeout:
+                raise
+            sleep(0.1)
+            waited += 0.1
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> dict:
+    """Takes two reports, returns per scenario the relative change (%) of p50/p95/p99/throughput and the regressions"""
+    changes, regressions = {}, []
+    for driver, scenarios in report["results"].items():
+        for name, current in scenarios.items():
+            previous = baseline.get("results", {}).get(driver, {}).get(name)
+            if not previous or not current.get("count") or not previous.get("count"):
+                continue
+
+            change = {}
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+                if previous.get(metric):
+                    change[metric] = round((current[metric] - previous[metric]) / previous[metric] * 100, 1)
+            changes.setdefault(driver, {})[name] = change
+
+            # p95 is the headline number, p50 moves too much on a busy machine to gate on
+            if change.get("p95_ms", 0) > threshold:
+                regressions.append(f"{driver}/{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms "
+                                   f"(+{change['p95_ms']}%)")
+
+    return {"threshold_pct": threshold, "changes": changes, "regressions": regressions}
+
+
+@click.command()
+@click.option("--users", default=1000, show_default=True)
+@click.option("--stores", default=50, show_default=True)
+@click.option("--items", default=5000, show_default=True)
+@click.option("--activations", default=2000, show_default=True, help="At least one per user.")
+@click.option("--images", default=200, show_default=True, help="Owned by the benchmark user.")
+@click.option("--iterations", "-n", default=200, show_default=True, help="Requests per scenario and driver.")
+@click.option("--warmup", default=10, show_default=True, help="Untimed requests before each read scenario.")
+@click.option("--driver", type=click.Choice(DRIVERS + ("both",)), default="both", show_default=True)
+@click.option("--workers", default=4, show_default=True, help="Server processes.")
+@click.option("--threaded/--no-threaded", default=False, show_default=True, help="Threads inside each server process.")
+@click.option("--concurrency", "-c", default=8, show_default=True, help="Client threads against the server.")
+@click.option("--only", multiple=True, help="Run only these scenarios (repeatable).")
+@click.option("--bcrypt-rounds", default=4, show_default=True, help="Work factor for login / register.")
+@click.option("--output", "-o", default="-", help="Report file, defaults to stdout.")
+@click.option("--compare", "baseline", type=click.File("r"), default=None, help="Baseline report to compare with.")
+@click.option("--threshold", default=10.0, show_default=True, help="p95 growth (%) counted as a regression.")
+@click.option("--replica", is_flag=True, help="Read GET requests from a lagging copy of the database.")
+@click.option("--keep", is_flag=True, help="Keep the scratch database and images.")
+def main(users, stores, items, activations, images, iterations, warmup, driver, workers, threaded, concurrency, only,
+         bcrypt_rounds, output, baseline, threshold, replica, keep):
+    """Benchmarks every API route and prints a JSON latency / throughput report."""
+    # load_app moves to the project root
+    if output != "-":
+        output = os.path.abspath(output)
+
+    workdir = tempfile.mkdtemp(prefix="rest-api-bench-")
+    try:
+        app = load_app(workdir, replica, BCRYPT_LOG_ROUNDS=bcrypt_rounds, BCRYPT_CALIBRATE=False)
+        volumes = {"users": users, "stores": stores, "items": items, "activations": activations, "images": images}
+        click.echo(f"seeding {volumes} into {workdir}", err=True)
+        seed(app, **volumes)
+        if replica:
+            snapshot_replica(workdir)
+
+        from libs.variants import variants
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "volumes": volumes,
+                "iterations": iterations,
+                "workers": workers,
+                "threaded": threaded,
+                "concurrency": concurrency,
+                "bcrypt_rounds": bcrypt_rounds,
+                "replica": replica,
+            },
+            "results": {},
+        }
+
+        for name in DRIVERS:
+            if driver not in (name, "both"):
+                continue
+
+            ctx = BenchContext(app, name[0], volumes)
+            scenarios = build_scenarios(ctx, variants.available)
+            report["uncovered_routes"] = uncovered_routes(app, scenarios)
+            if only:
+                scenarios = [scenario for scenario in scenarios if scenario.name in only]
+
+            click.echo(f"running {len(scenarios)} scenario(s) through the {name}", err=True)
+            if name == "client":
+                report["results"][name] = run_client(app, scenarios, iterations, warmup)
+            else:
+                report["results"][name] = run_server(app, scenarios, iterations, warmup, workers, concurrency,
+                                                     threaded)
+
+        if baseline:
+            report["comparison"] = compare(report, json.load(baseline), threshold)
+    finally:
+        if keep:
+            click.echo(f"scratch data kept in {workdir}", err=True)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with click.open_file(output, "w") as file_object:
+        json.dump(report, file_object, indent=2)
+        file_object.write("\n")
+
+    if baseline and report["comparison"]["regressions"]:
+        for regression in report["comparison"]["regressions"]:
+            click.echo(f"REGRESSION {regression}", err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
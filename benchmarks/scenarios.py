@@ -0,0 +1,156 @@
+"""
+benchmarks.scenarios
+
+One scenario per route and method registered in `app.py`. Scenarios run in the
+order below and each one runs `iterations` times, so a scenario can rely on
+the rows the previous ones created (post, put, then delete the same items).
+
+Names created while benchmarking carry the driver's tag, running the test client
+and the server against the same database never collides.
+"""
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.environment import BENCH_USERNAME, BENCH_PASSWORD, make_png
+
+API_PREFIX = "/api/v1"
+BULK_ROWS = 100
+
+
+class Call:
+    def __init__(self, method: str, path: str, json=None, upload: Tuple[str, bytes] = None,
+                 headers: Dict[str, str] = None, expect: int = 200, api: bool = True):
+        self.method = method
+        self.path = API_PREFIX + path if api else path
+        self.json = json
+        self.upload = upload
+        self.headers = headers or {}
+        self.expect = expect
+
+
+class Scenario:
+    def __init__(self, name: str, endpoint: str, method: str, build: Callable[[int], Call],
+                 setup: Callable[[], None] = None, warm: bool = None):
+        self.name = name
+        self.endpoint = endpoint
+        self.method = method
+        self.build = build
+        self.setup = setup
+        # only calls that can be repeated with the same outcome are warmed up
+        self.warm = method == "GET" if warm is None else warm
+
+
+class BenchContext:
+    """What the scenarios need to know about the app: tokens, seeded volumes and database lookups"""
+
+    def __init__(self, app, tag: str, volumes: Dict[str, int]):
+        self.app = app
+        self.tag = tag
+        self.volumes = volumes
+        self.png = make_png()
+        self.ids = {}
+
+        with self.app.app_context():
+            from flask_jwt_extended import create_access_token, create_refresh_token
+
+            self.auth = {"Authorization": f"Bearer {create_access_token(identity=1, fresh=True)}"}
+            self.refresh = {"Authorization": f"Bearer {create_refresh_token(1)}"}
+
+    def new_auth(self) -> Dict[str, str]:
+        """A token of its own, for calls that revoke it"""
+        with self.app.app_context():
+            from flask_jwt_extended import create_access_token
+
+            return {"Authorization": f"Bearer {create_access_token(identity=1, fresh=True)}"}
+
+    def load_registered(self) -> None:
+        """Looks up the users registered by the `register` scenario and their most recent activation"""
+        from models.activation import ActivationModel
+        from models.user import UserModel
+
+        with self.app.app_context():
+            users = UserModel.query.filter(UserModel.username.like(f"{self.tag}r%")).order_by(UserModel.id).all()
+            latest = {}
+            for activation in ActivationModel.query.filter(ActivationModel.user_id.in_([user.id for user in users])):
+                if activation.user_id not in latest or activation.expire_at >= latest[activation.user_id].expire_at:
+                    latest[activation.user_id] = activation
+
+            self.ids["users"] = [user.id for user in users]
+            self.ids["activations"] = [latest[user.id].id for user in users if user.id in latest]
+
+
+def build_scenarios(ctx: BenchContext, variants_available: bool = False) -> List[Scenario]:
+    tag = ctx.tag
+    stores = max(ctx.volumes.get("stores", 1), 1)
+    items = max(ctx.volumes.get("items", 1), 1)
+    auth = ctx.auth
+    png = ctx.png
+
+    scenarios = [
+        Scenario("login", "userlogin", "POST", lambda i: Call(
+            "POST", "/login", json={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})),
+        Scenario("refresh", "tokenrefresh", "POST", lambda i: Call("POST", "/refresh", headers=ctx.refresh)),
+        Scenario("user_get", "user", "GET", lambda i: Call("GET", "/user/1", headers=auth)),
+        Scenario("activations_get", "activationbyuser", "GET", lambda i: Call("GET", "/activation/user/1")),
+
+        Scenario("store_get", "store", "GET", lambda i: Call("GET", f"/store/store{i % stores}")),
+        Scenario("store_list", "storelist", "GET", lambda i: Call("GET", "/stores?limit=50")),
+        Scenario("store_post", "store", "POST", lambda i: Call("POST", f"/store/{tag}s{i}", expect=201)),
+        Scenario("store_delete", "store", "DELETE", lambda i: Call("DELETE", f"/store/{tag}s{i}")),
+
+        Scenario("item_get", "item", "GET", lambda i: Call("GET", f"/item/item{i % items}", headers=auth)),
+        Scenario("item_list", "itemlist", "GET", lambda i: Call("GET", "/items?limit=50", headers=auth)),
+        Scenario("item_post", "item", "POST", lambda i: Call(
+            "POST", f"/item/{tag}i{i}", json={"price": 9.99, "store_id": 1}, headers=auth, expect=201)),
+        Scenario("item_put", "item", "PUT", lambda i: Call(
+            "PUT", f"/item/{tag}i{i}", json={"price": 19.99, "store_id": 1}, headers=auth)),
+        Scenario("item_delete", "item", "DELETE", lambda i: Call("DELETE", f"/item/{tag}i{i}", headers=auth)),
+        Scenario("item_bulk", "itembulk", "POST", lambda i: Call(
+            "POST", "/items/bulk?mode=upsert",
+            json=[{"name": f"{tag}b{i}_{row}", "price": 1.0 + row, "store_id": 1} for row in range(BULK_ROWS)],
+            headers=auth)),
+        Scenario("export_items", "export", "GET", lambda i: Call("GET", "/export/items?format=ndjson", headers=auth)),
+
+        Scenario("register", "userregister", "POST", lambda i: Call(
+            "POST", "/register",
+            json={"username": f"{tag}r{i}", "email": f"{tag}r{i}@example.org", "password": BENCH_PASSWORD},
+            expect=201)),
+        Scenario("activation_resend", "activationbyuser", "POST", lambda i: Call(
+            "POST", f"/activation/user/{ctx.ids['users'][i]}", expect=201), setup=ctx.load_registered),
+        Scenario("activate", "activation", "GET", lambda i: Call(
+            "GET", f"/user_activate/{ctx.ids['activations'][i]}"), setup=ctx.load_registered, warm=False),
+        Scenario("user_delete", "user", "DELETE", lambda i: Call(
+            "DELETE", f"/user/{ctx.ids['users'][i]}", headers=auth)),
+
+        Scenario("image_upload", "imageupload", "POST", lambda i: Call(
+            "POST", "/upload/image", upload=(f"{tag}u{i}.png", png), headers=auth, expect=201)),
+        Scenario("image_get", "image", "GET", lambda i: Call("GET", f"/image/{tag}u{i}.png", headers=auth)),
+        Scenario("image_list", "imagelist", "GET", lambda i: Call("GET", "/images?limit=50", headers=auth)),
+        Scenario("image_delete", "image", "DELETE", lambda i: Call("DELETE", f"/image/{tag}u{i}.png", headers=auth)),
+        Scenario("avatar_upload", "avatarupload", "PUT", lambda i: Call(
+            "PUT", "/upload/avatar", upload=("avatar.png", png), headers=auth)),
+        Scenario("avatar_get", "avatar", "GET", lambda i: Call("GET", "/avatar/1", headers=auth)),
+
+        Scenario("logout", "userlogout", "POST", lambda i: Call("POST", "/logout", headers=ctx.new_auth())),
+        Scenario("metrics", "metrics", "GET", lambda i: Call("GET", "/metrics", api=False)),
+    ]
+
+    if variants_available:
+        index = next(position for position, scenario in enumerate(scenarios) if scenario.name == "image_list")
+        scenarios.insert(index, Scenario("image_variant", "image", "GET", lambda i: Call(
+            "GET", f"/image/{tag}u{i}.png?w=32&fmt=webp", headers=auth)))
+
+    return scenarios
+
+
+def uncovered_routes(app, scenarios: List[Scenario]) -> List[str]:
+    """Returns the `endpoint METHOD` pairs registered on the app that no scenario exercises"""
+    covered = {(scenario.endpoint, scenario.method) for scenario in scenarios}
+    missing = set()
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == "static":
+            continue
+        for method in rule.methods - {"HEAD", "OPTIONS"}:
+            if (rule.endpoint, method) not in covered:
+                missing.add(f"{rule.endpoint} {method} {rule.rule}")
+
+    return sorted(missing)
@@ -0,0 +1,153 @@
+"""
+benchmarks.serialization
+
+Dump + JSON encoding cost of the list endpoints, run from the project root:
+
+    python -m benchmarks.serialization --items 5000 --limit 500 -o serialization.json
+
+Every list scenario is driven through the Flask test client in each mode, the
+modes taking turns request by request:
+
+- `current`: instances dumped by the marshmallow fields, encoded by the stdlib,
+- `fast_encoder`: the same dump, encoded with `libs.fastjson` (orjson when installed),
+- `fast_dump`: column tuples through `fast_dump`, encoded by the stdlib,
+- `fast`: both, the default configuration.
+
+The modes must answer the same JSON (compared after decoding) or the command
+exits with status 1. The report has the p50/p95/p99 of each scenario and mode
+(as `benchmarks.run` reports them), and the p50 speedup of each mode over
+`current`.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Dict
+
+import click
+
+from benchmarks.environment import load_app, seed
+from benchmarks.run import summarize
+from benchmarks.scenarios import API_PREFIX, BenchContext
+
+MODES = {
+    "current": {"JSON_FAST_ENCODER": False, "SCHEMA_FAST_DUMP": False},
+    "fast_encoder": {"JSON_FAST_ENCODER": True, "SCHEMA_FAST_DUMP": False},
+    "fast_dump": {"JSON_FAST_ENCODER": False, "SCHEMA_FAST_DUMP": True},
+    "fast": {"JSON_FAST_ENCODER": True, "SCHEMA_FAST_DUMP": True},
+}
+
+
+def run_modes(app, paths: Dict[str, str], headers: Dict[str, str], iterations: int, warmup: int) -> tuple:
+    """Returns the report entries of every mode and scenario, and the decoded bodies of the last requests"""
+    client = app.test_client()
+    results, bodies = {mode: {} for mode in MODES}, {mode: {} for mode in MODES}
+    for name, path in paths.items():
+        for settings in MODES.values():
+            app.config.update(settings)
+            for _ in range(warmup):
+                client.get(path, headers=headers).get_data()
+
+        # the modes take turns, a machine getting busier slows all of them alike
+        latencies = {mode: [] for mode in MODES}
+        errors = dict.fromkeys(MODES, 0)
+        for _ in range(iterations):
+            for mode, settings in MODES.items():
+                app.config.update(settings)
+                request_started = perf_counter()
+                response = client.get(path, headers=headers)
+                body = response.get_data()
+                latencies[mode].append(perf_counter() - request_started)
+                if response.status_code != 200:
+                    errors[mode] += 1
+                bodies[mode][name] = body
+
+        for mode in MODES:
+            # throughput over the time spent in the mode's own requests
+            results[mode][name] = summarize(latencies[mode], errors[mode], sum(latencies[mode]))
+            bodies[mode][name] = json.loads(bodies[mode][name])
+
+    return results, bodies
+
+
+def speedups(results: Dict[str, dict]) -> Dict[str, dict]:
+    """Returns per mode and scenario how many times faster than `current` the p50 is"""
+    baseline = results["current"]
+    return {
+        mode: {
+            name: round(baseline[name]["p50_ms"] / entry["p50_ms"], 2)
+            for name, entry in scenarios.items() if entry.get("p50_ms")
+        }
+        for mode, scenarios in results.items() if mode != "current"
+    }
+
+
+@click.command()
+@click.option("--stores", default=50, show_default=True)
+@click.option("--items", default=5000, show_default=True)
+@click.option("--limit", default=500, show_default=True, help="Rows per page requested.")
+@click.option("--iterations", "-n", default=100, show_default=True, help="Requests per scenario and mode.")
+@click.option("--warmup", default=10, show_default=True, help="Untimed requests before each scenario.")
+@click.option("--output", "-o", default="-", help="Report file, defaults to stdout.")
+def main(stores, items, limit, iterations, warmup, output):
+    """Compares the current and the fast dump / JSON encoding paths of the list endpoints."""
+    from libs import fastjson
+
+    if output != "-":
+        output = os.path.abspath(output)
+
+    workdir = tempfile.mkdtemp(prefix="rest-api-serialization-")
+    try:
+        app = load_app(workdir)
+        volumes = {"users": 1, "stores": stores, "items": items, "activations": 1, "images": 0}
+        click.echo(f"seeding {volumes} into {workdir}", err=True)
+        seed(app, **volumes)
+        ctx = BenchContext(app, "s", volumes)
+
+        paths = {
+            "item_list": f"{API_PREFIX}/items?limit={limit}",
+            "store_list": f"{API_PREFIX}/stores?limit={min(limit, stores)}",
+        }
+        click.echo(f"running {', '.join(MODES)}", err=True)
+        results, bodies = run_modes(app, paths, ctx.auth, iterations, warmup)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    mismatches = [
+        f"{mode}/{name}" for mode in MODES for name in paths if bodies[mode][name] != bodies["current"][name]
+    ]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "orjson": fastjson.available,
+            "iterations": iterations,
+            "volumes": {"stores": stores, "items": items, "limit": limit},
+        },
+        "results": results,
+        "speedup_p50": speedups(results),
+        "mismatches": mismatches,
+    }
+
+    with click.open_file(output, "w") as file_object:
+        json.dump(report, file_object, indent=2)
+        file_object.write("\n")
+
+    failed = False
+    for mismatch in mismatches:
+        click.echo(f"DIFFERENT RESPONSE {mismatch}", err=True)
+        failed = True
+    errors = [f"{mode}/{name}" for mode, scenarios in results.items() for name, entry in scenarios.items()
+              if entry["errors"]]
+    if errors:
+        click.echo(f"ERRORS IN {', '.join(errors)}", err=True)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
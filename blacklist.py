@@ -1,9 +1,136 @@
 """
 blacklist.py
 
-This file just contains the blacklist of the JWT tokens–it will be imported by
+This file contains the blacklist of the JWT tokens–it will be imported by
 app and the logout resource so that tokens can be added to the blacklist when the
 user logs out.
+
+Revoked `jti`s are persisted in the `token_blocklist` table, so they survive
+restarts and are shared by every worker process. Each row is pruned once the
+token's `exp` has passed (the token is rejected as expired from then on anyway).
+
+To keep the per-request check off the database, every process keeps a Bloom
+filter of the revoked `jti`s in front of the table, synced with the rows added
+by other processes at most every `JWT_BLOCKLIST_SYNC_INTERVAL` seconds, plus a
+small cache of confirmed revocations. A token not in the filter is not revoked
+(no query), only filter hits that are not cached cost a lookup.
 """
+import threading
+from time import monotonic, time
+
+from sqlalchemy import func, select
+
+from libs.bloom import BloomFilter
+from libs.cache import LRUCache, MISSING
+from libs.db import db
+from models.blocklist import TokenBlocklistModel
+
+# used for tokens created without an expiration
+MAX_RETENTION = 30 * 24 * 3600  # 30 DAYS
+
+
+class Blocklist:
+    def __init__(self):
+        self.sync_interval = 1.0
+        self.prune_interval = 300
+        self.capacity = 100_000
+        self._table = TokenBlocklistModel.__table__
+        self._bloom = BloomFilter(self.capacity)
+        self._revoked = LRUCache(max_size=4096, ttl=MAX_RETENTION)
+        self._last_id = 0
+        self._next_sync = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.sync_interval = app.config.get("JWT_BLOCKLIST_SYNC_INTERVAL", self.sync_interval)
+        self.prune_interval = app.config.get("JWT_BLOCKLIST_PRUNE_INTERVAL", self.prune_interval)
+        self.capacity = app.config.get("JWT_BLOCKLIST_CAPACITY", self.capacity)
+        self._bloom = BloomFilter(self.capacity)
+        app.extensions["jwt_blocklist"] = self
+
+    def add(self, jti: str, expire_at: int = None) -> None:
+        if expire_at is None:
+            expire_at = int(time()) + MAX_RETENTION
+
+        # the blocklist uses its own connection so it never commits the request's session
+        with db.engine.begin() as connection:
+            connection.execute(self._table.insert().values(jti=jti, expire_at=expire_at))
+
+        with self._lock:
+            self._bloom.add(jti)
+        self._revoked.set(jti, True)
+
+    def __contains__(self, jti: str) -> bool:
+        self._maybe_sync()
+
+        if jti not in self._bloom:
+            return False
+
+        if self._revoked.get(jti) is not MISSING:
+            return True
+
+        # either revoked by another process or a bloom false positive
+        with db.engine.connect() as connection:
+            row = connection.execute(select(self._table.c.id).where(self._table.c.jti == jti)).first()
+
+        if row:
+            self._revoked.set(jti, True)
+            return True
+
+        return False
+
+    def _maybe_sync(self) -> None:
+        now = monotonic()
+        if now < self._next_sync:
+            return
+
+        # only one thread syncs, the others keep answering from the current filter
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            if now >= self._next_prune:
+                self._prune()
+                self._rebuild()
+                self._next_prune = now + self.prune_interval
+            elif self._bloom.saturated:
+                self._rebuild()
+            else:
+                self._pull()
+            self._next_sync = now + self.sync_interval
+        finally:
+            self._lock.release()
+
+    def _pull(self, bloom: BloomFilter = None, last_id: int = None) -> None:
+        """Adds the rows inserted (by any process) since the last sync to the filter"""
+        bloom = self._bloom if bloom is None else bloom
+        last_id = self._last_id if last_id is None else last_id
+        query = (
+            select(self._table.c.id, self._table.c.jti)
+            .where(self._table.c.id > last_id)
+            .order_by(self._table.c.id)
+        )
+        with db.engine.connect() as connection:
+            for _id, jti in connection.execute(query):
+                bloom.add(jti)
+                last_id = _id
+
+        self._last_id = last_id
+
+    def _rebuild(self) -> None:
+        """Rebuilds the filter from scratch, dropping pruned entries and resizing if it got saturated"""
+        with db.engine.connect() as connection:
+            live = connection.execute(select(func.count()).select_from(self._table)).scalar()
+
+        # fill the new filter before swapping it in, readers never see a partial one
+        bloom = BloomFilter(max(self.capacity, live * 2))
+        self._pull(bloom, 0)
+        self._bloom = bloom
+
+    def _prune(self) -> None:
+        with db.engine.begin() as connection:
+            connection.execute(self._table.delete().where(self._table.c.expire_at < int(time())))
+
 
-BLACKLIST = set()
+BLACKLIST = Blocklist()
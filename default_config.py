@@ -2,15 +2,78 @@ import os
 
 DEBUG = True
 PORT = 5000
+DEFAULT_LOCALE = "en-us"  # or "pt-br", a file in strings/, used when Accept-Language matches none
 
 SECRET_KEY = os.environ.get("APP_SECRET_KEY", "App_-_s3CR3t_-_k3y")
 
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "jWt_-_s3CR3t_-_k3y")
 JWT_BLOCKLIST_ENABLED = True
 JWT_BLOCKLIST_TOKEN_CHECKS = ["access", "refresh"]
+JWT_BLOCKLIST_SYNC_INTERVAL = 1.0  # seconds a token revoked by another worker may still pass here
+JWT_BLOCKLIST_PRUNE_INTERVAL = 300
+JWT_BLOCKLIST_CAPACITY = 100_000
+
+BCRYPT_LOG_ROUNDS = 12
+BCRYPT_CALIBRATE = False  # per worker at startup, prefer setting BCRYPT_LOG_ROUNDS from `flask calibrate-bcrypt`
+BCRYPT_LATENCY_BUDGET_MS = 250
+BCRYPT_MIN_LOG_ROUNDS = 10
+BCRYPT_MAX_LOG_ROUNDS = 16
+BCRYPT_MAX_WORKERS = 2  # hashing processes per worker, 0 hashes inline
+BCRYPT_MAX_PENDING = 16  # hashes running or queued before requests are turned away
+BCRYPT_QUEUE_TIMEOUT = 2.0  # seconds to wait for a free slot before answering 503
+BCRYPT_RETRY_AFTER = 1
 
 SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URI", "sqlite:///data.db")
+# a read replica bound under SQLALCHEMY_REPLICA_BIND takes the SELECTs of GET requests
+SQLALCHEMY_BINDS = {"replica": os.environ["DATABASE_REPLICA_URI"]} if os.environ.get("DATABASE_REPLICA_URI") else {}
+SQLALCHEMY_REPLICA_BIND = "replica"  # key of the replica in SQLALCHEMY_BINDS, routing is off while it is not bound
+SQLALCHEMY_REPLICA_FALLBACK = True  # a lookup that finds nothing on the replica runs again on the primary
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+SCHEMA_UPGRADE_ON_START = False  # what `flask init-db` does, in create_app; handy in development
+SQLITE_PROFILE_ENABLED = True  # WAL, pragmas and a connection pool, only applied to a file backed SQLite database
+SQLITE_JOURNAL_MODE = "WAL"  # readers keep going while a write commits
+SQLITE_SYNCHRONOUS = "NORMAL"  # fsync at checkpoints only, safe with WAL
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = 64 * 1024  # page cache per connection
+SQLITE_BUSY_TIMEOUT_MS = 5000  # a writer waits this long for the lock before failing
+SQLITE_POOL_SIZE = 5  # connections kept per worker process
+SQLITE_MAX_OVERFLOW = 10
+SQLITE_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+DB_LOCK_RETRIES = 3  # writes retried after a "database is locked" error
+DB_LOCK_RETRY_DELAY = 0.05  # seconds before the first retry, doubled on each one
 PROPAGATE_EXCEPTIONS = True
+JSON_FAST_ENCODER = True  # orjson when installed, off in debug (pretty-printed) or with RESTFUL_JSON settings
+SCHEMA_FAST_DUMP = True  # list endpoints dump column tuples instead of running the schema fields
+
+EMAIL_OUTBOX_AUTOSTART = True  # deliver from a background thread in each worker, else run `flask send-emails`
+EMAIL_OUTBOX_POLL_INTERVAL = 5  # seconds
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+
+ACTIVATION_REAPER_AUTOSTART = True  # delete expired activations from a background thread, else `flask reap-activations`
+ACTIVATION_REAPER_INTERVAL = 3600  # seconds
+ACTIVATION_REAPER_BATCH_SIZE = 500  # rows per delete transaction
+ACTIVATION_RETENTION = 24 * 3600  # seconds an expired, unconfirmed activation is kept
 
 UPLOADED_IMAGES_DEST = os.path.join("static", "images")
+IMAGE_CACHE_CONTROL = "private, max-age=3600"
+USE_X_SENDFILE = False  # apache/lighttpd send the image bytes
+IMAGE_ACCEL_REDIRECT_PREFIX = None  # nginx internal location mapped to IMAGE_ACCEL_REDIRECT_ROOT, e.g. "/protected"
+IMAGE_ACCEL_REDIRECT_ROOT = "static"
+
+MODEL_CACHE_ENABLED = True
+MODEL_CACHE_MAX_SIZE = 1024
+MODEL_CACHE_TTL = 30  # seconds, bounds staleness across worker processes
+
+IMAGE_VARIANT_FOLDER = os.path.join("static", "variants")
+IMAGE_VARIANT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANT_PREGENERATE = []  # (width, height, format) rendered right after each upload, e.g. [(64, 64, "webp")]
+
+METRICS_ENABLED = True
+METRICS_PATH = "/metrics"  # Prometheus text format, keep it off the public listener
+
+SQL_PROFILER_ENABLED = False  # development / staging only, flags N+1s and slow queries per request
+SQL_PROFILER_REPEAT_THRESHOLD = 3  # same statement run more often than this in one request
+SQL_PROFILER_SLOW_MS = 100
+SQL_PROFILER_REPORT = "sql_profile.json"  # JSON report of the findings, None to only log them
@@ -1,3 +1,135 @@
+"""
+libs.bc
+
+Password hashing. bcrypt is deliberately slow CPU work, so `hasher` runs it in a
+dedicated process pool (the GIL is not a factor) with a bounded number of
+hashes in flight or queued. When every slot stays taken for longer than the
+queue timeout, `HasherBusyException` is raised and the resource answers 503
+with `Retry-After` instead of pinning the worker. So is a hash whose process
+died, the pool starts a new one for the next call.
+
+Uses the same `BCRYPT_*` settings as Flask-Bcrypt, so existing hashes verify.
+`flask calibrate-bcrypt` prints the highest cost that hashes within
+`BCRYPT_LATENCY_BUDGET_MS` on this machine, to set as `BCRYPT_LOG_ROUNDS` for
+every worker. `BCRYPT_CALIBRATE` instead picks it at startup, in each worker on
+its own. Hashes stored with a lower cost are rehashed on the next successful
+login; a higher one is kept, so workers calibrated apart never rehash a
+password back and forth.
+"""
+import hashlib
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+
+import bcrypt
 from flask_bcrypt import Bcrypt
 
+from libs.i18n import get_text
+from libs.worker import LazyProcessPool
+
 bc = Bcrypt()
+
+
+class HasherBusyException(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _hash_password(password: bytes, rounds: int, prefix: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds, prefix))
+
+
+def _check_password(pw_hash: bytes, password: bytes) -> bool:
+    return bcrypt.checkpw(password, pw_hash)
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.rounds = 12
+        self.prefix = b"2b"
+        self.handle_long_passwords = False
+        self.max_workers = 2
+        self.max_pending = 16
+        self.queue_timeout = 2.0
+        self.retry_after = 1
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = LazyProcessPool(self.max_workers)
+
+    def init_app(self, app) -> None:
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", self.rounds)
+        self.prefix = app.config.get("BCRYPT_HASH_PREFIX", "2b").encode("ascii")
+        self.handle_long_passwords = app.config.get("BCRYPT_HANDLE_LONG_PASSWORDS", self.handle_long_passwords)
+        self.max_workers = app.config.get("BCRYPT_MAX_WORKERS", self.max_workers)
+        self.max_pending = app.config.get("BCRYPT_MAX_PENDING", self.max_pending)
+        self.queue_timeout = app.config.get("BCRYPT_QUEUE_TIMEOUT", self.queue_timeout)
+        self.retry_after = app.config.get("BCRYPT_RETRY_AFTER", self.retry_after)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = LazyProcessPool(self.max_workers)
+
+        if app.config.get("BCRYPT_CALIBRATE", False):
+            self.rounds = self.calibrate(
+                app.config.get("BCRYPT_LATENCY_BUDGET_MS", 250),
+                app.config.get("BCRYPT_MIN_LOG_ROUNDS", 10),
+                app.config.get("BCRYPT_MAX_LOG_ROUNDS", 16)
+            )
+            app.logger.info("bcrypt calibrated to %s log rounds", self.rounds)
+
+        app.extensions["password_hasher"] = self
+
+    def calibrate(self, budget_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> int:
+        """Benchmarks hashing on this machine and returns the highest cost (log rounds) that fits in the budget"""
+        # every extra round doubles the work: time a cheap probe, extrapolate, then confirm with a real hash
+        probe_rounds = 6
+        elapsed = min(self._time_hash(probe_rounds) for _ in range(3))
+        rounds = probe_rounds
+        while rounds < max_rounds and elapsed * 2 <= budget_ms:
+            rounds += 1
+            elapsed *= 2
+
+        rounds = max(rounds, min_rounds)
+        while rounds > min_rounds and self._time_hash(rounds) > budget_ms:
+            rounds -= 1
+
+        return rounds
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        """Returns whether the hash was made with a lower cost than the current one ('$2b$12$...')"""
+        try:
+            return int(pw_hash.split("$")[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def generate_password_hash(self, password: str) -> str:
+        pw_hash = self._run(_hash_password, self._encode(password), self.rounds, self.prefix)
+        return pw_hash.decode("utf-8")
+
+    def check_password_hash(self, pw_hash: str, password: str) -> bool:
+        return self._run(_check_password, pw_hash.encode("utf-8"), self._encode(password))
+
+    def _encode(self, password: str) -> bytes:
+        password = password.encode("utf-8")
+        if self.handle_long_passwords:
+            password = hashlib.sha256(password).hexdigest().encode("utf-8")
+        return password
+
+    def _time_hash(self, rounds: int) -> float:
+        started = perf_counter()
+        _hash_password(b"calibration-password", rounds, self.prefix)
+        return (perf_counter() - started) * 1000
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusyException(get_text("hasher_busy"), self.retry_after)
+
+        try:
+            if self.max_workers == 0:
+                return function(*args)
+            return self._pool.submit(function, *args).result()
+        except BrokenProcessPool:
+            raise HasherBusyException(get_text("hasher_busy"), self.retry_after)
+        finally:
+            self._slots.release()
+
+
+hasher = PasswordHasher()
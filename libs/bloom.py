@@ -0,0 +1,39 @@
+"""
+libs.bloom
+
+Minimal Bloom filter: a compact set that answers "definitely not present" or
+"maybe present" in O(k) for k hash functions, without storing the members.
+"""
+import math
+from hashlib import blake2b
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        # double hashing: two 64 bit halves of one digest generate every position
+        digest = blake2b(value.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def saturated(self) -> bool:
+        """Once past capacity the false positive rate climbs above `error_rate`"""
+        return self.count > self.capacity
@@ -0,0 +1,190 @@
+"""
+libs.cache
+
+Read-through cache for model lookups such as `find_by_name` and `find_all`.
+
+Rows are cached as plain column snapshots (never live ORM instances), so any
+backend can hold them and no object is ever shared between sessions. A cache
+hit rebuilds the instance and merges it into the current session without
+touching the database. Writes invalidate the affected keys from `save_to_db`
+and `delete_from_db`.
+
+The in-process `LRUCache` is the default backend. Invalidation is local to the
+process, so with several workers the TTL bounds how stale a lookup can get.
+A shared backend (e.g. redis) only needs to implement `CacheBackend`.
+
+Since a cached row may be stale, lookups that are followed by a write (update,
+delete, uniqueness check) bypass the cache with `fresh=True` and read the row
+from the database. A lookup racing with a write never caches what it read
+before the write: every invalidation bumps a generation, and a loader result is
+only stored if no invalidation happened while it was loading.
+"""
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Union
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from libs.db import db
+
+MISSING = object()
+
+
+class CacheBackend:
+    """Interface implemented by every cache backend. Values are plain python data (dicts, lists, None)."""
+
+    def get(self, key: str) -> Any:
+        """Returns the cached value or `MISSING`"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread safe in-process LRU cache with a per entry time to live (in seconds)"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            expire_at, value = entry
+            if expire_at <= monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class ModelCache:
+    def __init__(self, backend: CacheBackend = None):
+        self.backend = backend
+        self.enabled = True
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get("MODEL_CACHE_ENABLED", True)
+        if self.backend is None:
+            self.backend = LRUCache(
+                max_size=app.config.get("MODEL_CACHE_MAX_SIZE", 1024),
+                ttl=app.config.get("MODEL_CACHE_TTL", 30)
+            )
+        app.extensions["model_cache"] = self
+
+    def get_or_load(self, model: type, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result for `key`, calling `loader` on a miss.
+        `loader` must return a model instance, a list of instances or None.
+        """
+        if not self.enabled or self.backend is None:
+            return loader()
+
+        full_key = self._key(model, key)
+        snapshot = self.backend.get(full_key)
+        if snapshot is MISSING:
+            generation = self._generation
+            result = loader()
+            snapshot = self._snapshot(result)
+            # under the lock of `invalidate`: either it runs after this and deletes the entry, or it ran meanwhile
+            with self._lock:
+                if generation == self._generation:
+                    self.backend.set(full_key, snapshot)
+            return result
+
+        return self._restore(model, snapshot)
+
+    def invalidate(self, model: type, *keys: str) -> None:
+        if self.backend is not None:
+            with self._lock:
+                self._generation += 1
+                self.backend.delete(*(self._key(model, key) for key in keys))
+
+    def stats(self) -> Dict[str, int]:
+        if self.backend is None:
+            return {}
+        return self.backend.stats()
+
+    @classmethod
+    def _key(cls, model: type, key: str) -> str:
+        return f"{model.__tablename__}:{key}"
+
+    @classmethod
+    def _snapshot(cls, result: Any) -> Union[dict, list, None]:
+        if result is None:
+            return None
+        if isinstance(result, list):
+            return [cls._snapshot(each) for each in result]
+
+        mapper = inspect(result).mapper
+        return {column.key: getattr(result, column.key) for column in mapper.column_attrs}
+
+    @classmethod
+    def _restore(cls, model: type, snapshot: Union[dict, list, None]) -> Any:
+        if snapshot is None:
+            return None
+        if isinstance(snapshot, list):
+            return [cls._restore(model, each) for each in snapshot]
+
+        instance = model(**snapshot)
+        make_transient_to_detached(instance)
+        # load=False attaches the row without a SELECT, reusing the instance already in the session if any
+        return db.session.merge(instance, load=False)
+
+
+cache = ModelCache()
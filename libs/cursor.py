@@ -0,0 +1,72 @@
+"""
+libs.cursor
+
+Keyset (cursor) pagination helpers shared by the list resources.
+
+A page is requested with `?limit=&after=`, where `after` is the opaque cursor
+returned as `next` by the previous page. Cursors encode the last seen `id`, so
+every page is a `WHERE id > :after ORDER BY id LIMIT :limit` index range scan
+and costs the same no matter how deep into the table it is.
+"""
+import base64
+import binascii
+from typing import Mapping, Tuple, Union
+
+from libs.i18n import get_text
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+class CursorException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def encode_cursor(last_id: int) -> str:
+    """Takes the id of the last row of a page and returns an opaque cursor"""
+    return base64.urlsafe_b64encode(str(last_id).encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Takes an opaque cursor and returns the id it points after"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = int(base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii"))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise CursorException(get_text("pagination_invalid_cursor"))
+
+    if last_id < 0:
+        raise CursorException(get_text("pagination_invalid_cursor"))
+
+    return last_id
+
+
+def parse_page_args(args: Mapping[str, str]) -> Tuple[int, Union[int, None]]:
+    """Takes the request query args and returns (limit, after_id)"""
+    limit = args.get("limit", DEFAULT_PAGE_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise CursorException(get_text("pagination_invalid_limit").format(MAX_PAGE_LIMIT))
+
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise CursorException(get_text("pagination_invalid_limit").format(MAX_PAGE_LIMIT))
+
+    after = args.get("after")
+    if after:
+        return limit, decode_cursor(after)
+
+    return limit, None
+
+
+def next_cursor(rows: list, limit: int) -> Union[str, None]:
+    """
+    Takes the rows fetched with `limit + 1` and returns the cursor for the next page, or None on the last page.
+    The extra look-ahead row is removed from `rows` in place.
+    """
+    if len(rows) <= limit:
+        return None
+
+    del rows[limit:]
+    return encode_cursor(rows[-1].id)
@@ -1,3 +1,67 @@
-from flask_sqlalchemy import SQLAlchemy
+import functools
+import random
+from time import sleep
 
-db = SQLAlchemy()
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+
+from libs.replica import RoutingQuery, RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy(query_class=RoutingQuery)
+
+# rows per IN (...) lookup, stays below SQLite's default limit of 999 bound parameters
+IN_BATCH_SIZE = 500
+
+LOCK_ERRORS = ("database is locked", "database table is locked")
+LOCK_RETRY_MAX_DELAY = 1.0  # seconds, whatever the attempt
+
+
+def is_lock_error(err: Exception) -> bool:
+    return isinstance(err, OperationalError) and any(message in str(err.orig) for message in LOCK_ERRORS)
+
+
+def retry_on_lock(method):
+    """Retries a model write that timed out waiting for the SQLite writer lock, with a bounded exponential backoff"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        retries = current_app.config.get("DB_LOCK_RETRIES", 3)
+        delay = current_app.config.get("DB_LOCK_RETRY_DELAY", 0.05)
+        attempt = 0
+        while True:
+            pending = _pending_work(self)
+            try:
+                return method(self, *args, **kwargs)
+            except OperationalError as err:
+                db.session.rollback()
+                if attempt >= retries or not is_lock_error(err):
+                    raise
+
+            # the rollback expired or expunged what was being written, it goes back into the session
+            # (without flushing: setting an expired attribute loads it first)
+            added, deleted = pending
+            with db.session.no_autoflush:
+                for instance, values in added:
+                    for key, value in values.items():
+                        setattr(instance, key, value)
+                    db.session.add(instance)
+                for instance in deleted:
+                    db.session.delete(instance)
+
+            # jitter, so the writers that collided don't collide again
+            sleep(min(delay * 2 ** attempt, LOCK_RETRY_MAX_DELAY) * random.uniform(0.5, 1.0))
+            attempt += 1
+
+    return wrapper
+
+
+def _pending_work(instance) -> tuple:
+    """Takes the model being written, returns the column values of every new or changed object and the deleted ones"""
+    session = db.session
+    added = []
+    for model in {instance, *session.new, *session.dirty}:
+        state = inspect(model)
+        values = {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+        added.append((model, values))
+
+    return added, list(session.deleted)
@@ -0,0 +1,69 @@
+"""
+libs.fastdump
+
+"Fast dump" for the schemas of read-only list responses. Instead of loading
+instances and running every field of the schema on each of them, the rows are
+selected as plain tuples of `fast_columns` and `fast_dump` zips them with the
+keys `dump` would write.
+
+The values are written as the database driver returned them, nothing is
+converted or validated, so it is only meant for trusted output and only allowed
+on schemas made of plain column fields (integers, floats, strings, booleans)
+without dump hooks. Anything else raises `FastDumpException` when the schema is
+first used. Nested fields listed in `fast_dump_nested` are left to the schema,
+which fills them in its own `fast_dump`.
+"""
+from typing import Iterable, List, Sequence, Tuple
+
+from marshmallow import fields
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from sqlalchemy.orm import ColumnProperty
+
+# fields whose dump of a value read from the database is the value itself
+PLAIN_FIELDS = (fields.Integer, fields.Float, fields.String, fields.Boolean)
+
+
+class FastDumpException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class FastDumpMixin:
+    """For `SQLAlchemyAutoSchema`s, goes before the schema class in the bases"""
+
+    fast_dump_nested: Tuple[str, ...] = ()
+
+    @property
+    def fast_columns(self) -> list:
+        """The model columns to select for `fast_dump`, in the order it expects them"""
+        return [column for _, column in self._fast_fields()]
+
+    def fast_dump(self, rows: Iterable[Sequence]) -> List[dict]:
+        """Takes rows selected with `fast_columns` (extra trailing values are ignored), returns what `dump` would"""
+        keys = [key for key, _ in self._fast_fields()]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _fast_fields(self) -> list:
+        # [(data key, model column)], checked once per schema instance
+        cached = self.__dict__.get("_fast_field_list")
+        if cached is not None:
+            return cached
+
+        name = type(self).__name__
+        if any(self._hooks[(tag, many)] for tag in (PRE_DUMP, POST_DUMP) for many in (False, True)):
+            raise FastDumpException(f"{name} has dump hooks, fast dump would skip them")
+
+        model = self.opts.model
+        fast_fields = []
+        for attr_name, field in self.dump_fields.items():
+            if attr_name in self.fast_dump_nested:
+                continue
+
+            column = getattr(model, field.attribute or attr_name, None)
+            plain = isinstance(field, PLAIN_FIELDS) and not getattr(field, "as_string", False)
+            if not plain or not isinstance(getattr(column, "property", None), ColumnProperty):
+                raise FastDumpException(f"{name}.{attr_name} is not a plain column field, it can't be fast dumped")
+            fast_fields.append((field.data_key or attr_name, column))
+
+        self._fast_field_list = fast_fields
+        return fast_fields
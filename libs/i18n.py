@@ -1,23 +1,164 @@
 """
 libs.i18n
 
-By default, uses `en-us.json` file inside the `strings` top-level folder.
+Every catalog in the `strings` top-level folder (`en-us.json`, `pt-br.json`, ...)
+is loaded once, by `init_app` or on the first `get_text`, into read-only
+mappings. Nothing touches the disk afterwards.
 
-If language changes, run `libs.i18n.change_locale()`
+The locale is picked per request from `Accept-Language`, among the catalogs,
+falling back to the default locale (`DEFAULT_LOCALE`, or `change_locale()`).
+Negotiation results are cached per header value, so a request only pays for a
+dict lookup. Outside of a request (CLI, background tasks) the default locale is
+used.
+
+Templates are parsed when loading: a broken placeholder, or a translation whose
+placeholders differ from the default locale's, fails at startup instead of in
+the `get_text(...).format(...)` of some request. A key missing from a catalog
+falls back to the default locale's text.
 """
 import json
+import os
+import string
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping, Tuple
+
+from flask import _request_ctx_stack
+
+STRINGS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "strings")
+NEGOTIATION_CACHE_SIZE = 512
 
 default_locale = "en-us"
-cached_strings = {}
+catalogs = MappingProxyType({})
+
+
+class I18nException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def init_app(app) -> None:
+    load_catalogs(app.config.get("I18N_FOLDER", STRINGS_FOLDER))
+    change_locale(app.config.get("DEFAULT_LOCALE", default_locale))
+    app.after_request(_add_language_headers)
+    app.extensions["i18n"] = catalogs
+
+
+def load_catalogs(folder: str = STRINGS_FOLDER) -> Mapping[str, Mapping[str, str]]:
+    """Takes the folder of the `<locale>.json` files, returns (and uses from now on) the validated catalogs"""
+    global catalogs
+    loaded = {}
+    for filename in sorted(os.listdir(folder)):
+        locale, extension = os.path.splitext(filename)
+        if extension == ".json":
+            with open(os.path.join(folder, filename), encoding="utf-8") as file_object:
+                loaded[_normalize(locale)] = json.load(file_object)
+
+    if default_locale not in loaded:
+        raise I18nException(f"No catalog for the default locale {default_locale} in {folder}")
+
+    # every locale has every key, missing translations read the default locale's text
+    fallback = loaded[default_locale]
+    fields = {name: _fields(default_locale, name, text) for name, text in fallback.items()}
+    for locale, texts in loaded.items():
+        for name, text in texts.items():
+            if name in fields and _fields(locale, name, text) != fields[name]:
+                raise I18nException(f"{locale}.json: the placeholders of {name!r} differ from {default_locale}.json")
+
+    catalogs = MappingProxyType({
+        locale: MappingProxyType({**fallback, **texts}) for locale, texts in loaded.items()
+    })
+    negotiate.cache_clear()
+    return catalogs
 
 
 def change_locale(locale: str) -> None:
-    global cached_strings
+    """Sets the locale used when a request doesn't ask for one we have, and outside of requests"""
     global default_locale
+    if not catalogs:
+        load_catalogs()
+
+    locale = _normalize(locale)
+    if locale not in catalogs:
+        raise I18nException(f"No catalog for the locale {locale}, have {', '.join(catalogs)}")
     default_locale = locale
-    with open(f"strings/{default_locale}.json", encoding="utf-8") as file_object:
-        cached_strings = json.load(file_object)
+    negotiate.cache_clear()
+
+
+def get_locale() -> str:
+    top = _request_ctx_stack.top
+    if top is None:
+        return default_locale
+
+    current = top.request
+    locale = getattr(current, "locale", None)
+    if locale is None:
+        locale = current.locale = negotiate(current.headers.get("Accept-Language", ""))
+    return locale
 
 
 def get_text(name: str) -> str:
-    return cached_strings[name]
+    if not catalogs:
+        load_catalogs()
+    return catalogs[get_locale()][name]
+
+
+@lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def negotiate(accept_language: str) -> str:
+    """Takes an `Accept-Language` header value, returns the best locale we have a catalog for"""
+    for tag in _parse_accept_language(accept_language):
+        if tag == "*":
+            return default_locale
+        if tag in catalogs:
+            return tag
+        # "pt" or "pt-PT" is still better served by "pt-br" than by the default
+        language = tag.split("-", 1)[0]
+        for locale in catalogs:
+            if locale.split("-", 1)[0] == language:
+                return locale
+
+    return default_locale
+
+
+def _parse_accept_language(accept_language: str) -> List[str]:
+    """Returns the language tags of the header, most preferred first, leaving out the refused ones (q=0)"""
+    weighted = []
+    for position, part in enumerate(accept_language.split(",")):
+        tag, _, params = part.partition(";")
+        tag = _normalize(tag)
+        if not tag:
+            continue
+
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            weighted.append((-quality, position, tag))
+
+    return [tag for _, _, tag in sorted(weighted)]
+
+
+def _fields(locale: str, name: str, text: str) -> Tuple[str, ...]:
+    try:
+        return tuple(sorted(field for _, field, _, _ in string.Formatter().parse(text) if field is not None))
+    except ValueError as err:
+        raise I18nException(f"{locale}.json: {name!r} is not a valid template ({err})")
+
+
+def _normalize(tag: str) -> str:
+    return tag.strip().lower().replace("_", "-")
+
+
+def _add_language_headers(response):
+    # only responses that were translated depend on the header
+    current = _request_ctx_stack.top.request
+    locale = getattr(current, "locale", None)
+    if locale is not None:
+        response.headers["Content-Language"] = locale
+        response.vary.add("Accept-Language")
+    return response
@@ -1,16 +1,253 @@
+import hashlib
+import importlib.util
+import mimetypes
 import os
+import posixpath
 import re
-from typing import Union
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Tuple, Union
 from werkzeug.datastructures import FileStorage
 
-from flask_uploads import UploadSet, IMAGES
+from flask import Request, Response, current_app, request, send_file
+from flask_uploads import UploadSet, UploadNotAllowed, IMAGES, extension
+
+from libs.cache import LRUCache, MISSING
+from libs.upload import UploadStream
+
+# Pillow is optional, and only imported by the first `get_image_size`: it costs every worker start otherwise
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
 
 IMAGE_SET = UploadSet("images", IMAGES)
+BLOB_FOLDER = "blobs"
+# the endpoints (flask-restful names them after the resource) whose files are streamed into the blob folder
+IMAGE_UPLOAD_ENDPOINTS = frozenset(("imageupload", "avatarupload"))
+
+# content hashes by (path, mtime, size), so a replaced file never reuses a stale hash
+_hashes = LRUCache(max_size=4096, ttl=24 * 3600)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        """Streams the files uploaded to the image endpoints straight into the blob folder, checked and hashed"""
+        if self.endpoint not in IMAGE_UPLOAD_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return UploadStream(get_folder(BLOB_FOLDER), self.max_content_length)
 
 
 def save_image(image: FileStorage, folder: str = None, name: str = None) -> str:
-    """Takes FileStorage and saves it to a folder"""
-    return IMAGE_SET.save(image, folder, name)
+    """
+    Takes FileStorage and saves it to a folder, same contract as `UploadSet.save`.
+    The content is stored once as a blob named after its SHA-256, the per-user file name is a hard link to it,
+    so identical uploads cost no extra disk and the blob's link count is its reference count.
+    """
+    basename = IMAGE_SET.get_basename(image.filename)
+    if name:
+        basename = name + extension(basename) if name.endswith(".") else name
+
+    if not IMAGE_SET.file_allowed(image, basename):
+        raise UploadNotAllowed()
+
+    target_folder = get_folder(folder) if folder else IMAGE_SET.config.destination
+    os.makedirs(target_folder, exist_ok=True)
+
+    with _stored_blob(image) as (digest, blob, source):
+        basename = _link_unique(blob, source, target_folder, basename)
+    _write_hash_sidecar(os.path.join(target_folder, basename), digest)
+
+    if folder:
+        return posixpath.join(folder, basename)
+    return basename
+
+
+def delete_image(path: str) -> None:
+    """Takes a full image path and deletes the image, its recorded hash and its blob once nothing else links to it"""
+    digest = get_image_hash(path)
+    os.remove(path)
+    try:
+        os.remove(_hash_sidecar(path))
+    except FileNotFoundError:
+        pass
+
+    blob = _blob_path(digest)
+    try:
+        if os.stat(blob).st_nlink <= 1:
+            os.remove(blob)
+    except FileNotFoundError:
+        pass
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_object:
+        for chunk in iter(lambda: file_object.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_image_hash(path: str) -> str:
+    """Returns the content hash of an image: from memory, else from the hash recorded at upload, else computed once"""
+    stat = os.stat(path)
+    memo_key = f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+    digest = _hashes.get(memo_key)
+    if digest is not MISSING:
+        return digest
+
+    sidecar = _hash_sidecar(path)
+    try:
+        with open(sidecar, encoding="ascii") as file_object:
+            digest = file_object.read().strip()
+        # a sidecar older than the image belongs to a previous upload
+        if os.stat(sidecar).st_mtime_ns < stat.st_mtime_ns:
+            digest = None
+    except FileNotFoundError:
+        digest = None
+
+    if not digest:
+        digest = hash_file(path)
+        _write_hash_sidecar(path, digest)
+
+    _hashes.set(memo_key, digest)
+    return digest
+
+
+def get_image_size(path: str) -> Tuple[Union[int, None], Union[int, None]]:
+    """Returns (width, height) read from the image header, (None, None) without Pillow or for formats it can't read"""
+    if not PILLOW_AVAILABLE:
+        return None, None
+
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+
+def send_image(path: str, etag: str = None) -> Response:
+    """
+    Sends an image with a strong ETag (its content hash), answering If-None-Match/If-Modified-Since with 304 and
+    Range requests with 206, plus the configured Cache-Control.
+    With `IMAGE_ACCEL_REDIRECT_PREFIX` (nginx) or `USE_X_SENDFILE` (apache, lighttpd) the front proxy sends the bytes.
+    """
+    config = current_app.config
+    etag = etag or get_image_hash(path)
+
+    accel_prefix = config.get("IMAGE_ACCEL_REDIRECT_PREFIX")
+    if accel_prefix:
+        root = config.get("IMAGE_ACCEL_REDIRECT_ROOT", "static")
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{os.path.relpath(path, root)}"
+        response.last_modified = os.path.getmtime(path)
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+    else:
+        response = send_file(path, add_etags=False, conditional=False)
+        response.set_etag(etag)
+        # with X-Sendfile the body (and so the byte ranges) is left to the proxy
+        response = response.make_conditional(
+            request,
+            accept_ranges=not current_app.use_x_sendfile,
+            complete_length=os.path.getsize(path)
+        )
+
+    response.headers["Cache-Control"] = config.get("IMAGE_CACHE_CONTROL", "private, max-age=3600")
+    return response
+
+
+def _blob_path(digest: str) -> str:
+    # fanned out over two directory levels so no directory grows too large
+    return os.path.join(get_folder(BLOB_FOLDER), digest[:2], digest[2:4], digest)
+
+
+@contextmanager
+def _stored_blob(image: FileStorage, chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, str, str]]:
+    """
+    Files the upload as a blob unless it already exists, yields (digest, blob path, source) where `source` is a
+    file with the same content that stays on disk until the block ends, to file the blob again if it goes away.
+    """
+    if isinstance(image.stream, UploadStream):
+        # streamed by `UploadRequest`: already on disk next to the blobs and hashed, removed with the request
+        digest = image.stream.hexdigest()
+        blob = _blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            image.stream.link(blob)
+        except FileExistsError:
+            pass
+        yield digest, blob, image.stream.name
+        return
+
+    blob_root = get_folder(BLOB_FOLDER)
+    os.makedirs(blob_root, exist_ok=True)
+
+    digest = hashlib.sha256()
+    handle, temporary = tempfile.mkstemp(dir=blob_root, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file_object:
+            for chunk in iter(lambda: image.stream.read(chunk_size), b""):
+                digest.update(chunk)
+                file_object.write(chunk)
+
+        digest = digest.hexdigest()
+        blob = _blob_path(digest)
+        _file_blob(temporary, blob)
+        yield digest, blob, temporary
+    finally:
+        os.remove(temporary)
+
+
+def _file_blob(source: str, blob: str) -> None:
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        # link instead of rename: an identical blob filed meanwhile is kept, not replaced
+        os.link(source, blob)
+    except FileExistsError:
+        pass
+
+
+def _link_unique(blob: str, source: str, target_folder: str, basename: str) -> str:
+    """
+    Links the blob into the folder under `basename`, suffixing `_1`, `_2`... only when the name is taken.
+    `source` holds the same content, it files the blob again when a concurrent delete removed it meanwhile.
+    """
+    name, ext = os.path.splitext(basename)
+    candidate = basename
+    count = 0
+    while True:
+        target = os.path.join(target_folder, candidate)
+        try:
+            os.link(blob, target)
+            return candidate
+        except FileExistsError:
+            count += 1
+            candidate = f"{name}_{count}{ext}"
+        except FileNotFoundError:
+            # the last image linking to the blob was deleted since it was filed, `delete_image` removed it
+            _file_blob(source, blob)
+        except OSError:
+            # no hard links on this filesystem, fall back to a private copy
+            try:
+                with open(source, "rb") as source_file, open(target, "xb") as destination:
+                    shutil.copyfileobj(source_file, destination)
+                return candidate
+            except FileExistsError:
+                count += 1
+                candidate = f"{name}_{count}{ext}"
+
+
+def _hash_sidecar(path: str) -> str:
+    # hidden file, `is_filename_safe` never lets it be requested as an image
+    folder, basename = os.path.split(path)
+    return os.path.join(folder, f".{basename}.sha256")
+
+
+def _write_hash_sidecar(path: str, digest: str) -> None:
+    with open(_hash_sidecar(path), "w", encoding="ascii") as file_object:
+        file_object.write(digest)
 
 
 def get_path(filename: str = None, folder: str = None) -> str:
@@ -18,6 +255,11 @@ def get_path(filename: str = None, folder: str = None) -> str:
     return IMAGE_SET.path(filename, folder)
 
 
+def get_folder(folder: str) -> str:
+    """Takes a folder name and returns its full path inside the upload destination"""
+    return os.path.join(IMAGE_SET.config.destination, folder)
+
+
 def find_image_any_format(filename: str = None, folder: str = None) -> Union[str, None]:
     """Takes a filename and folder and returns an image on any of the accepted formats"""
     for _format in IMAGES:
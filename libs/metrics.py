@@ -0,0 +1,225 @@
+"""
+libs.metrics
+
+Request metrics in the Prometheus text format, served from `METRICS_PATH`.
+
+For every request: latency histogram and status counter per endpoint (the flask
+endpoint, so `/item/<name>` is one series whatever the name), the number of
+requests in flight, and how many SQL statements it ran and how long they took,
+counted with SQLAlchemy cursor events. A request is recorded when its response
+is closed, after the body was sent: streamed responses (NDJSON lists, exports)
+include the time and the queries spent generating it. A view that raised
+(propagated with `PROPAGATE_EXCEPTIONS`, no `after_request`) is recorded at
+teardown as a 500. Extra stats (e.g. the model cache) are added with `add_stats`.
+
+Recording is a few dict lookups and a bisect under one lock, no allocation per
+request beyond the label tuples. Metrics live in the process, with several
+workers each one reports its own: scrape the workers, not the load balancer.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+from flask import Response, _request_ctx_stack
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per bucket counts (+inf last), sum]
+        self._series = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        """Callers hold the registry lock"""
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, (counts, total) in sorted(self._series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{{{labels},le=\"{bound}\"}} {cumulative}"
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+
+    def inc(self, label_values: Tuple[str, ...], amount: float = 1) -> None:
+        """Callers hold the registry lock"""
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._series.items()):
+            yield f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}"
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self.path = "/metrics"
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._stats = []
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Time spent handling the request.", ("endpoint", "method"),
+            LATENCY_BUCKETS
+        )
+        self.responses = Counter("http_requests_total", "Responses sent.", ("endpoint", "method", "status"))
+        self.sql_count = Histogram(
+            "http_request_sql_statements", "SQL statements executed per request.", ("endpoint", "method"),
+            SQL_COUNT_BUCKETS
+        )
+        self.sql_time = Histogram(
+            "http_request_sql_duration_seconds", "Time spent in SQL statements per request.", ("endpoint", "method"),
+            SQL_TIME_BUCKETS
+        )
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get("METRICS_ENABLED", self.enabled)
+        self.path = app.config.get("METRICS_PATH", self.path)
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(self.path, "metrics", self.render_response)
+        # class level: also covers the engine Flask-SQLAlchemy creates later
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.extensions["metrics"] = self
+
+    def add_stats(self, prefix: str, stats: Callable[[], Dict[str, float]], gauges: Sequence[str] = ("size",)) -> None:
+        """Exposes a `stats()` dict as `<prefix>_<key>`, counters (`_total`) unless the key is listed in `gauges`"""
+        self._stats.append((prefix, stats, tuple(gauges)))
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP http_requests_in_flight Requests being handled.",
+                "# TYPE http_requests_in_flight gauge",
+                f"http_requests_in_flight {self.in_flight}",
+            ]
+            for metric in (self.latency, self.responses, self.sql_count, self.sql_time):
+                lines.extend(metric.render())
+
+        for prefix, stats, gauges in self._stats:
+            for key, value in sorted(stats().items()):
+                if key in gauges:
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+                else:
+                    lines.append(f"# TYPE {prefix}_{key}_total counter")
+                    lines.append(f"{prefix}_{key}_total {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def render_response(self) -> Response:
+        return Response(self.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+    # the request is taken from the context stack once, every `flask.request` / `g` lookup costs a few microseconds
+    def _before_request(self) -> None:
+        # start, SQL statements, SQL seconds, answered (recorded when the response closes)
+        _request_ctx_stack.top.request.metrics = [perf_counter(), 0, 0.0, False]
+        with self._lock:
+            self.in_flight += 1
+
+    def _after_request(self, response: Response) -> Response:
+        current = _request_ctx_stack.top.request
+        counters = getattr(current, "metrics", None)
+        if counters is None or counters[3]:
+            return response
+
+        counters[3] = True
+        # unmatched URLs share one series, so random 404s can't blow up the cardinality
+        labels = (current.endpoint or "unmatched", current.method)
+        status = str(response.status_code)
+        # a streamed body is generated after this, the statements it runs still count into `counters`
+        response.call_on_close(lambda: self._record(counters, labels, status))
+        return response
+
+    def _record(self, counters: list, labels: Tuple[str, str], status: str) -> None:
+        started, statements, sql_seconds, answered = counters
+        if answered is None:
+            return
+
+        counters[3] = None
+        elapsed = perf_counter() - started
+        with self._lock:
+            self.latency.observe(labels, elapsed)
+            self.responses.inc(labels + (status,))
+            self.sql_count.observe(labels, statements)
+            self.sql_time.observe(labels, sql_seconds)
+            self.in_flight -= 1
+
+    def _teardown_request(self, exception) -> None:
+        # only not answered when something raised and `_after_request` was skipped
+        current = _request_ctx_stack.top.request
+        counters = getattr(current, "metrics", None)
+        if counters is None or counters[3] is not False:
+            return
+
+        if exception is not None:
+            # propagated unhandled error (PROPAGATE_EXCEPTIONS), the client gets a 500
+            self._record(counters, (current.endpoint or "unmatched", current.method), "500")
+        else:
+            counters[3] = None
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # the execution context lives exactly as long as the statement, a failed one leaves nothing behind
+    if context is not None:
+        context.metrics_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # statements run by background threads (outbox, blocklist sync) belong to no request
+    top = _request_ctx_stack.top
+    if context is None or top is None:
+        return
+
+    counters = getattr(top.request, "metrics", None)
+    if counters is not None:
+        counters[1] += 1
+        counters[2] += perf_counter() - context.metrics_started
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -1,9 +1,12 @@
 import os
-from typing import List
-from requests import Response, post
+from typing import TYPE_CHECKING, List
 
 from libs.i18n import get_text
 
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+
 class MailgunException(Exception):
     def __init__(self, message: str):
         super().__init__(message)
@@ -12,29 +15,67 @@ class MailgunException(Exception):
 class Mailgun:
     MAILGUN_DOMAIN = os.environ.get("MAILGUN_DOMAIN")
     MAILGUN_API_KEY = os.environ.get("MAILGUN_API_KEY")
+    # point it at a local stand-in server to test without the real provider
+    MAILGUN_API_URL = os.environ.get("MAILGUN_API_URL", "https://api.mailgun.net/v3")
 
     FROM_TITLE = "Stores REST API"
     FROM_EMAIL = f"do-not-reply@{MAILGUN_DOMAIN}"
 
+    TIMEOUT = 10  # seconds
+
+    _session = None
+
     @classmethod
-    def send_email(cls, email: List[str], subject: str, text: str, html: str) -> Response:
+    def check_config(cls) -> None:
         if cls.MAILGUN_DOMAIN is None:
             raise MailgunException(get_text("mailgun_failed_load_domain"))
 
         if cls.MAILGUN_API_KEY is None:
             raise MailgunException(get_text("mailgun_failed_load_api_key"))
 
-        response = post(
-            f"https://api.mailgun.net/v3/{cls.MAILGUN_DOMAIN}/messages",
-            auth=("api", cls.MAILGUN_API_KEY),
-            data={
-                "from": f"{cls.FROM_TITLE} <{cls.FROM_EMAIL}>",
-                "to": email,
-                "subject": subject,
-                "text": text,
-                "html": html
-            }
-        )
+    @classmethod
+    def get_session(cls) -> "Session":
+        """Pooled session, connections (and their TLS handshakes) are reused between emails"""
+        if cls._session is None:
+            # requests takes longer to import than the rest of the app, only workers that send emails pay for it
+            from requests import Session
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retries = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=False  # retry POST too
+            )
+            session = Session()
+            session.auth = ("api", cls.MAILGUN_API_KEY)
+            session.mount("https://", HTTPAdapter(max_retries=retries, pool_maxsize=4))
+            session.mount("http://", HTTPAdapter(max_retries=retries, pool_maxsize=4))
+            cls._session = session
+
+        return cls._session
+
+    @classmethod
+    def send_email(cls, email: List[str], subject: str, text: str, html: str) -> "Response":
+        from requests import RequestException
+
+        cls.check_config()
+
+        try:
+            response = cls.get_session().post(
+                f"{cls.MAILGUN_API_URL}/{cls.MAILGUN_DOMAIN}/messages",
+                data={
+                    "from": f"{cls.FROM_TITLE} <{cls.FROM_EMAIL}>",
+                    "to": email,
+                    "subject": subject,
+                    "text": text,
+                    "html": html
+                },
+                timeout=cls.TIMEOUT
+            )
+        except RequestException as err:
+            raise MailgunException(str(err)) from err
 
         if response.status_code != 200:
             raise MailgunException(get_text("mailgun_failed_send_email"))
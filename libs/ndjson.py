@@ -0,0 +1,44 @@
+"""
+libs.ndjson
+
+Streaming `application/x-ndjson` representation for list resources.
+
+Rows are dumped one at a time as the query yields them and written out in
+chunks, so memory stays flat no matter how big the table is. The first row is
+flushed on its own so clients get the first byte right away. Rows are encoded
+with `libs.fastjson`, orjson when it is installed.
+"""
+from typing import Iterable
+
+from flask import Response, request, stream_with_context
+from marshmallow import Schema
+
+from libs.fastjson import dumps
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson() -> bool:
+    """Returns whether the client prefers NDJSON over plain JSON"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def stream_ndjson(rows: Iterable, schema: Schema, batch_size: int = STREAM_BATCH_SIZE) -> Response:
+    """Takes an iterable of models and a (single object) schema and returns a streamed NDJSON response"""
+    def generate():
+        chunk = []
+        first = True
+        for row in rows:
+            chunk.append(dumps(schema.dump(row)))
+            if first or len(chunk) >= batch_size:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+                first = False
+
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    # keep the request context (and with it the db session) alive while streaming
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,249 @@
+"""
+libs.profiler
+
+Opt-in SQL profiler for development and staging (`SQL_PROFILER_ENABLED`).
+
+Every statement run during a request is fingerprinted: whitespace collapsed,
+literals replaced by `?` and expanded `IN (?, ?, ...)` lists folded, so the same
+query with other values is counted as one. At the end of the request it flags
+
+- statements repeated more than `SQL_PROFILER_REPEAT_THRESHOLD` times, the
+  signature of an N+1 (a lazy load or a query per dumped row),
+- statements slower than `SQL_PROFILER_SLOW_MS`,
+
+with the resource, the marshmallow schema (if a dump or load triggered it) and
+the project stack that ran the query. Findings are logged and collected into
+the JSON report at `SQL_PROFILER_REPORT`. Tests can read the report or call
+`profiler.assert_clean()`.
+
+Walking the stack is not cheap, never enable it in production.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import List, Tuple, Union
+
+from flask import _request_ctx_stack
+from marshmallow import Schema
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STACK_DEPTH = 12
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SQLProfilerException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def normalize_statement(statement: str) -> str:
+    """Takes a SQL statement and returns it without its values, the same query always normalizes the same way"""
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PLACEHOLDERS.sub("(?+)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.sha1(normalize_statement(statement).encode("utf-8")).hexdigest()[:16]
+
+
+class RequestProfile:
+    """The statements of one request, by fingerprint"""
+
+    def __init__(self):
+        # fingerprint -> [count, total seconds, max seconds, normalized statement, origin]
+        self.statements = {}
+        self.slow = []
+
+
+class SQLProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.repeat_threshold = 3
+        self.slow_ms = 100
+        self.report_path = None
+        self.app = None
+        self._findings = {}
+        self._reported = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get("SQL_PROFILER_ENABLED", self.enabled)
+        self.repeat_threshold = app.config.get("SQL_PROFILER_REPEAT_THRESHOLD", self.repeat_threshold)
+        self.slow_ms = app.config.get("SQL_PROFILER_SLOW_MS", self.slow_ms)
+        self.report_path = app.config.get("SQL_PROFILER_REPORT", self.report_path)
+        if not self.enabled:
+            return
+
+        self.app = app
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.extensions["sql_profiler"] = self
+
+    @property
+    def findings(self) -> List[dict]:
+        with self._lock:
+            return [dict(finding) for finding in self._findings.values()]
+
+    def report(self) -> dict:
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "repeat_threshold": self.repeat_threshold,
+            "slow_ms": self.slow_ms,
+            "findings": sorted(self.findings, key=lambda finding: (finding["kind"], finding["endpoint"] or "")),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._findings = {}
+            self._reported = False
+
+    def assert_clean(self) -> None:
+        """Raises SQLProfilerException listing every finding, for tests that must not add N+1s or slow queries"""
+        findings = self.findings
+        if findings:
+            summary = "\n".join(
+                f"{finding['kind']} {finding['method']} {finding['endpoint']}: {finding['statement'][:120]} "
+                f"(x{finding['count']}, {finding['max_ms']}ms, schema {finding['schema']})"
+                for finding in findings
+            )
+            raise SQLProfilerException(f"{len(findings)} SQL finding(s):\n{summary}")
+
+    def _before_request(self) -> None:
+        _request_ctx_stack.top.request.sql_profile = RequestProfile()
+
+    def _teardown_request(self, exception) -> None:
+        current = _request_ctx_stack.top.request
+        profile = getattr(current, "sql_profile", None)
+        if profile is None:
+            return
+        current.sql_profile = None
+
+        flagged = [
+            ("repeated", key, entry)
+            for key, entry in profile.statements.items()
+            if entry[0] > self.repeat_threshold
+        ]
+        flagged += [("slow", key, entry) for key, entry in profile.slow]
+        if not flagged:
+            # an empty report tells a test run the profiler was on and found nothing
+            if self.report_path and not self._reported:
+                self._write_report()
+            return
+
+        view = self.app.view_functions.get(current.endpoint)
+        resource = getattr(view, "view_class", view)
+        for kind, key, (count, total, longest, statement, (schema, stack)) in flagged:
+            self.app.logger.warning(
+                "SQL %s in %s %s (%s): %sx, %.1fms max, schema %s: %s\n  %s",
+                kind, current.method, current.path, current.endpoint, count, longest * 1000, schema, statement,
+                "\n  ".join(stack)
+            )
+            self._record({
+                "kind": kind,
+                "endpoint": current.endpoint,
+                "resource": getattr(resource, "__name__", None),
+                "method": current.method,
+                "path": current.path,
+                "fingerprint": key,
+                "statement": statement,
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "max_ms": round(longest * 1000, 3),
+                "schema": schema,
+                "stack": stack,
+            })
+
+        if self.report_path:
+            self._write_report()
+
+    def _record(self, finding: dict) -> None:
+        key = (finding["kind"], finding["endpoint"], finding["method"], finding["fingerprint"])
+        with self._lock:
+            previous = self._findings.get(key)
+            if previous is None:
+                self._findings[key] = {**finding, "requests": 1}
+            else:
+                previous["requests"] += 1
+                previous["count"] = max(previous["count"], finding["count"])
+                previous["max_ms"] = max(previous["max_ms"], finding["max_ms"])
+
+    def _write_report(self) -> None:
+        self._reported = True
+        folder = os.path.dirname(os.path.abspath(self.report_path))
+        handle, temporary = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(handle, "w", encoding="utf-8") as file_object:
+            json.dump(self.report(), file_object, indent=2)
+        os.replace(temporary, self.report_path)
+
+
+def _origin() -> Tuple[Union[str, None], List[str]]:
+    """Returns the marshmallow schema on the stack, if any, and the project frames that led to the query"""
+    schema = None
+    stack = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        if schema is None and isinstance(frame.f_locals.get("self"), Schema):
+            schema = type(frame.f_locals["self"]).__name__
+
+        filename = frame.f_code.co_filename
+        if len(stack) < STACK_DEPTH and _is_project_file(filename):
+            stack.append(f"{os.path.relpath(filename, ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+
+    return schema, stack
+
+
+def _is_project_file(filename: str) -> bool:
+    # generated code ("<string>") and a virtualenv inside the project are not project code
+    if filename.startswith("<") or "site-packages" in filename:
+        return False
+    filename = os.path.abspath(filename)
+    return filename.startswith(ROOT) and filename != os.path.abspath(__file__)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context.profiler_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    top = _request_ctx_stack.top
+    if context is None or top is None:
+        return
+
+    profile = getattr(top.request, "sql_profile", None)
+    if profile is None:
+        return
+
+    elapsed = perf_counter() - context.profiler_started
+    key = fingerprint(statement)
+    entry = profile.statements.get(key)
+    if entry is None:
+        # the stack of the first occurrence is the one every repetition shares
+        entry = profile.statements[key] = [0, 0.0, 0.0, normalize_statement(statement), _origin()]
+    entry[0] += 1
+    entry[1] += elapsed
+    entry[2] = max(entry[2], elapsed)
+
+    if elapsed * 1000 > profiler.slow_ms:
+        profile.slow.append((key, [1, elapsed, elapsed, entry[3], _origin()]))
+
+
+profiler = SQLProfiler()
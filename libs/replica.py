@@ -0,0 +1,121 @@
+"""
+libs.replica
+
+Read/write splitting for `db`: with a read replica bound in `SQLALCHEMY_BINDS`
+under `SQLALCHEMY_REPLICA_BIND`, the SELECTs of GET / HEAD requests run on the
+replica and everything else on the primary.
+
+The session sticks to the primary once it has written anything (a flush, an
+INSERT / UPDATE / DELETE statement), so a GET that writes reads its own writes
+for the rest of the request. Sessions outside a request (CLI, background tasks)
+always use the primary. The session is removed after every request, the next one
+starts on the replica again.
+
+A replica lags behind the primary: a row created a moment ago may not be there
+yet. With `SQLALCHEMY_REPLICA_FALLBACK` a `first()`, `one_or_none()` or `get()`
+that finds nothing on the replica is run again on the primary, which covers the
+`find_*` lookups. Lists are not retried, they may miss the latest rows for as
+long as the replica lags.
+
+`db.read_engine` follows the same rule for code that reads with a connection of
+its own, like the table export.
+"""
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+from flask import _request_ctx_stack
+from flask_sqlalchemy import BaseQuery, SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, autocommit=False, autoflush=True, **options):
+        super().__init__(db, autocommit=autocommit, autoflush=autoflush, **options)
+        self.db = db
+        self.replica_bind = replica_bind(self.app)
+        self.replica_fallback = self.app.config.get("SQLALCHEMY_REPLICA_FALLBACK", True)
+        self.wrote = False
+        self.read_on_replica = False
+        self._primary = 0
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica_bind is None:
+            return super().get_bind(mapper, clause)
+
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self.wrote = True
+        self.read_on_replica = self._use_replica(mapper, clause)
+        if self.read_on_replica:
+            return self.db.get_engine(self.app, bind=self.replica_bind)
+        return super().get_bind(mapper, clause)
+
+    @contextmanager
+    def primary(self) -> Iterator["RoutingSession"]:
+        """Runs every statement of the block on the primary, e.g. a read that must not lag"""
+        self._primary += 1
+        try:
+            yield self
+        finally:
+            self._primary -= 1
+
+    def _use_replica(self, mapper, clause) -> bool:
+        if self.wrote or self._primary or not isinstance(clause, Select):
+            return False
+        # a model bound to a database of its own stays there
+        if getattr(getattr(mapper, "persist_selectable", None), "info", {}).get("bind_key") is not None:
+            return False
+        return in_read_request()
+
+
+class RoutingQuery(BaseQuery):
+    """Runs a lookup that found nothing on the replica again on the primary, the row may not have replicated yet"""
+
+    def first(self):
+        return self._with_fallback(super().first)
+
+    def one_or_none(self):
+        return self._with_fallback(super().one_or_none)
+
+    def get(self, ident):
+        return self._with_fallback(lambda: super(RoutingQuery, self).get(ident))
+
+    def _with_fallback(self, load):
+        session = self.session
+        if not isinstance(session, RoutingSession) or session.replica_bind is None:
+            return load()
+
+        session.read_on_replica = False
+        result = load()
+        if result is None and session.read_on_replica and session.replica_fallback:
+            with session.primary():
+                result = load()
+        return result
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    @property
+    def read_engine(self) -> Engine:
+        """The replica's engine inside a GET / HEAD request when one is bound, the primary's otherwise"""
+        app = self.get_app()
+        bind = replica_bind(app)
+        if bind is not None and in_read_request():
+            return self.get_engine(app, bind=bind)
+        return self.get_engine(app)
+
+
+def replica_bind(app) -> Union[str, None]:
+    """Returns the bind key of the read replica, None while no replica is bound"""
+    bind = app.config.get("SQLALCHEMY_REPLICA_BIND")
+    return bind if bind and bind in (app.config.get("SQLALCHEMY_BINDS") or {}) else None
+
+
+def in_read_request() -> bool:
+    top = _request_ctx_stack.top
+    return top is not None and top.request.method in READ_METHODS
@@ -0,0 +1,96 @@
+"""
+libs.schema
+
+Creates the database schema, or brings an existing database up to date with the
+models. Run by `flask init-db`, never by a request.
+
+On top of `db.create_all()` (missing tables), the columns added to a model since
+its table was created are added with `ALTER TABLE ... ADD COLUMN`, then missing
+indexes are created. Only additive changes: nothing is dropped or altered, and a
+new column must be nullable or have a server default, like every column added
+so far. Tables bound to another database (the read replica) are left alone.
+
+The one exception is a SQLite table the model now declares with
+`sqlite_autoincrement`: SQLite can't add AUTOINCREMENT to an existing table, so
+it is rebuilt, its rows copied into the new table keeping their ids.
+"""
+from typing import List
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from libs.db import db
+
+
+class SchemaException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def upgrade_schema() -> List[str]:
+    """Returns a description of every change made to the database, nothing when it was up to date"""
+    engine = db.get_engine()
+    tables = [table for table in db.Model.metadata.sorted_tables if table.info.get("bind_key") is None]
+    existing = set(inspect(engine).get_table_names())
+
+    changes = [f"created table {table.name}" for table in tables if table.name not in existing]
+    db.Model.metadata.create_all(bind=engine, tables=tables)
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in tables:
+            if table.name not in existing:
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            if _lacks_autoincrement(connection, table):
+                _rebuild(connection, inspector, table, columns)
+                changes.append(f"rebuilt table {table.name} with AUTOINCREMENT")
+                continue
+
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise SchemaException(
+                        f"{table.name}.{column.name} is NOT NULL without a server default, it can't be added"
+                    )
+                spec = CreateColumn(column).compile(dialect=engine.dialect)
+                name = engine.dialect.identifier_preparer.format_table(table)
+                connection.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN {spec}")
+                changes.append(f"added column {table.name}.{column.name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=connection)
+                    changes.append(f"created index {index.name}")
+
+    return changes
+
+
+def _lacks_autoincrement(connection, table) -> bool:
+    if connection.dialect.name != "sqlite" or not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+    ).scalar()
+    return "AUTOINCREMENT" not in sql.upper()
+
+
+def _rebuild(connection, inspector, table, columns) -> None:
+    """Recreates `table` from the model, with the rows (and ids) of the existing one"""
+    preparer = connection.dialect.identifier_preparer
+    old_name = f"{table.name}__old"
+    connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} RENAME TO {preparer.quote(old_name)}")
+    # the indexes followed the renamed table, their names are needed for the new one
+    for index in inspector.get_indexes(old_name):
+        connection.exec_driver_sql(f"DROP INDEX {preparer.quote(index['name'])}")
+
+    table.create(bind=connection)
+    # the model's new columns are nullable or have a server default, the others are copied
+    copied = ", ".join(preparer.quote(column.name) for column in table.columns if column.name in columns)
+    connection.exec_driver_sql(
+        f"INSERT INTO {preparer.format_table(table)} ({copied}) SELECT {copied} FROM {preparer.quote(old_name)}"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {preparer.quote(old_name)}")
@@ -0,0 +1,106 @@
+"""
+libs.sqlite
+
+Production profile for a file backed SQLite database (`SQLITE_PROFILE_ENABLED`).
+
+Every new connection is switched to WAL, where readers never wait for the writer
+and the writer never waits for readers, with `synchronous=NORMAL` (durable at
+checkpoints, no fsync per commit), a memory-mapped file, a bigger page cache and
+a `busy_timeout` so a writer waits for the lock instead of failing right away.
+
+The engine keeps a small pool per worker process instead of Flask-SQLAlchemy's
+`NullPool` for SQLite, pragmas then run once per pooled connection and not on
+every checkout. Other databases, and in-memory SQLite, are left alone.
+
+A writer that still times out on the lock is retried by `libs.db.retry_on_lock`.
+"""
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class SQLiteProfile:
+    def __init__(self):
+        self.enabled = True
+        self.journal_mode = "WAL"
+        self.synchronous = "NORMAL"
+        self.mmap_size = 256 * 1024 * 1024
+        self.cache_size_kb = 64 * 1024
+        self.busy_timeout_ms = 5000
+        self.pool_size = 5
+        self.max_overflow = 10
+        self.pool_timeout = 30
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get("SQLITE_PROFILE_ENABLED", self.enabled)
+        self.journal_mode = app.config.get("SQLITE_JOURNAL_MODE", self.journal_mode).upper()
+        self.synchronous = app.config.get("SQLITE_SYNCHRONOUS", self.synchronous).upper()
+        self.mmap_size = app.config.get("SQLITE_MMAP_SIZE", self.mmap_size)
+        self.cache_size_kb = app.config.get("SQLITE_CACHE_SIZE_KB", self.cache_size_kb)
+        self.busy_timeout_ms = app.config.get("SQLITE_BUSY_TIMEOUT_MS", self.busy_timeout_ms)
+        self.pool_size = app.config.get("SQLITE_POOL_SIZE", self.pool_size)
+        self.max_overflow = app.config.get("SQLITE_MAX_OVERFLOW", self.max_overflow)
+        self.pool_timeout = app.config.get("SQLITE_POOL_TIMEOUT", self.pool_timeout)
+        if not self.enabled or not is_file_database(app.config.get("SQLALCHEMY_DATABASE_URI")):
+            return
+
+        # pragmas are interpolated into the statements, only known values get there
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {', '.join(JOURNAL_MODES)}")
+        if self.synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+
+        # read by Flask-SQLAlchemy when it creates the engine, explicit settings win
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+        options.setdefault("poolclass", QueuePool)
+        options.setdefault("pool_size", self.pool_size)
+        options.setdefault("max_overflow", self.max_overflow)
+        options.setdefault("pool_timeout", self.pool_timeout)
+        connect_args = dict(options.get("connect_args") or {})
+        # pooled connections move between the threads of a threaded server
+        connect_args.setdefault("check_same_thread", False)
+        connect_args.setdefault("timeout", self.busy_timeout_ms / 1000)
+        options["connect_args"] = connect_args
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+        # class level: the engine is only created on the first request
+        if not event.contains(Engine, "connect", self._on_connect):
+            event.listen(Engine, "connect", self._on_connect)
+        app.extensions["sqlite_profile"] = self
+
+    def pragmas(self) -> dict:
+        return {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "mmap_size": int(self.mmap_size),
+            # negative: size in KiB instead of pages
+            "cache_size": -int(self.cache_size_kb),
+            "busy_timeout": int(self.busy_timeout_ms),
+        }
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas().items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def is_file_database(uri: str) -> bool:
+    """Takes a database URI, returns whether it is SQLite stored in a file"""
+    if not uri or not uri.startswith("sqlite"):
+        return False
+    database = uri.split("://", 1)[-1].lstrip("/").split("?", 1)[0]
+    return database not in ("", ":memory:")
+
+
+sqlite_profile = SQLiteProfile()
@@ -0,0 +1,109 @@
+"""
+libs.upload
+
+Streaming file uploads.
+
+Werkzeug's form parser writes every uploaded file part into the stream returned
+by `Request._get_file_stream`. `UploadStream` is that stream: it writes straight
+to a temporary file in the destination folder while hashing the content, sniffs
+the magic bytes of the first chunk and aborts the request as soon as the body is
+not an image or grows past the size limit. Memory per upload stays at the
+parser's read buffer, the content is never held whole in memory and never read twice.
+"""
+import hashlib
+import os
+import tempfile
+import weakref
+from typing import Union
+
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from libs.i18n import get_text
+
+SNIFF_SIZE = 16
+
+# the formats of flask_uploads.IMAGES, by their leading bytes
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+)
+SVG_PREFIXES = (b"<?xml", b"<svg", b"<!--", b"<!doctype svg")
+
+
+def sniff_image_type(head: bytes) -> Union[str, None]:
+    """Takes the first bytes of a file and returns the image format they belong to, None if it isn't an image"""
+    for magic, kind in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n").lower().startswith(SVG_PREFIXES):
+        return "svg"
+
+    return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadStream:
+    def __init__(self, folder: str, max_size: int = None):
+        os.makedirs(folder, exist_ok=True)
+        handle, self.name = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        self.max_size = max_size
+        self.size = 0
+        self.kind = None
+        self._file = os.fdopen(handle, "w+b")
+        self._digest = hashlib.sha256()
+        self._head = b""
+        # the temporary file goes away with the stream, even if the request never closes it
+        self._finalizer = weakref.finalize(self, _remove, self.name)
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(get_text("image_too_large").format(self.max_size // (1024 * 1024)))
+
+        if self.kind is None and len(self._head) < SNIFF_SIZE:
+            self._head += data[:SNIFF_SIZE - len(self._head)]
+            if len(self._head) >= SNIFF_SIZE:
+                self._sniff()
+
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # the parser rewinds the stream once the part is complete, a file shorter than SNIFF_SIZE is sniffed here
+        if self.kind is None:
+            self._sniff()
+        return self._file.seek(offset, whence)
+
+    def hexdigest(self) -> str:
+        """Returns the SHA-256 of everything written so far"""
+        return self._digest.hexdigest()
+
+    def link(self, destination: str) -> None:
+        """Files the upload under `destination` in one atomic step, raises FileExistsError if it is already taken"""
+        self._file.flush()
+        os.link(self.name, destination)
+
+    def close(self) -> None:
+        self._file.close()
+        self._finalizer()
+
+    def _sniff(self) -> None:
+        self.kind = sniff_image_type(self._head)
+        if self.kind is None:
+            self.close()
+            raise UnsupportedMediaType(get_text("image_content_not_allowed"))
+
+    def __getattr__(self, name: str):
+        # read, readline, tell... come straight from the temporary file
+        return getattr(self._file, name)
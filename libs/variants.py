@@ -0,0 +1,183 @@
+"""
+libs.variants
+
+Resized / re-encoded variants of uploaded images, requested with `?w=&h=&fmt=`.
+
+Variants are rendered with Pillow in a process pool and cached on disk under
+`static/variants`, keyed by the content hash of the source image plus the
+requested parameters, so a re-upload never serves a stale variant. A cache hit costs a
+single `utime` (used as the LRU clock); once the cache grows past
+`IMAGE_VARIANT_CACHE_MAX_BYTES` the least recently used variants are evicted.
+
+Pillow is optional, without it `available` is False and only originals are served.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from typing import Mapping, Tuple, Union
+
+from libs.i18n import get_text
+from libs.im import get_image_hash
+from libs.worker import LazyProcessPool
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "jpg": "JPEG", "png": "PNG"}
+MAX_VARIANT_SIZE = 2048
+
+
+class VariantException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def _render_variant(source: str, destination: str, width: int, height: int, fmt: str) -> int:
+    """Runs in the process pool, returns the size of the written variant"""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        # thumbnail keeps the aspect ratio and never upscales
+        image.thumbnail((width or image.width, height or image.height))
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        temporary = f"{destination}.{os.getpid()}.tmp"
+        image.save(temporary, fmt)
+
+    os.replace(temporary, destination)
+    return os.path.getsize(destination)
+
+
+class VariantCache:
+    def __init__(self):
+        self.folder = os.path.join("static", "variants")
+        self.max_bytes = 512 * 1024 * 1024
+        self.pregenerate_sizes = ()
+        self._pool = LazyProcessPool(2)
+        self._pending = {}
+        self._size = None
+        # reentrant: a render that already finished runs its done callback inside `_submit`
+        self._lock = threading.RLock()
+
+    def init_app(self, app) -> None:
+        self.folder = app.config.get("IMAGE_VARIANT_FOLDER", self.folder)
+        self.max_bytes = app.config.get("IMAGE_VARIANT_CACHE_MAX_BYTES", self.max_bytes)
+        self.pregenerate_sizes = app.config.get("IMAGE_VARIANT_PREGENERATE", self.pregenerate_sizes)
+        self._pool = LazyProcessPool(app.config.get("IMAGE_VARIANT_WORKERS", 2))
+        app.extensions["image_variants"] = self
+
+    @property
+    def available(self) -> bool:
+        return PIL is not None
+
+    @classmethod
+    def parse_args(cls, args: Mapping[str, str]) -> Union[Tuple[int, int, str], None]:
+        """Takes the request query args and returns (width, height, format) or None when no variant was asked for"""
+        if not any(key in args for key in ("w", "h", "fmt")):
+            return None
+
+        try:
+            width = int(args.get("w", 0))
+            height = int(args.get("h", 0))
+        except ValueError:
+            raise VariantException(get_text("image_variant_invalid_size").format(MAX_VARIANT_SIZE))
+
+        if not (0 <= width <= MAX_VARIANT_SIZE and 0 <= height <= MAX_VARIANT_SIZE):
+            raise VariantException(get_text("image_variant_invalid_size").format(MAX_VARIANT_SIZE))
+
+        fmt = args.get("fmt", "webp").lower()
+        if fmt not in VARIANT_FORMATS:
+            raise VariantException(get_text("image_variant_invalid_format").format(fmt))
+
+        return width, height, fmt
+
+    def get(self, source: str, width: int, height: int, fmt: str) -> str:
+        """Returns the path of the variant, rendering it (and waiting for it) on a cache miss"""
+        destination, future = self._submit(source, width, height, fmt)
+        if future is None:
+            return destination
+
+        try:
+            future.result()
+        except FileNotFoundError:
+            raise
+        except Exception:
+            raise VariantException(get_text("image_variant_error"))
+
+        return destination
+
+    def pregenerate(self, source: str) -> None:
+        """Renders the configured common sizes in the background right after an upload"""
+        if not self.available:
+            return
+
+        for width, height, fmt in self.pregenerate_sizes:
+            self._submit(source, width, height, fmt)
+
+    def _submit(self, source: str, width: int, height: int, fmt: str) -> Tuple[str, Union[Future, None]]:
+        key = hashlib.sha256(f"{get_image_hash(source)}:{width}x{height}.{fmt}".encode("ascii")).hexdigest()
+        destination = os.path.join(self.folder, key[:2], f"{key}.{fmt}")
+
+        try:
+            # a hit only bumps the mtime, which is what eviction orders by
+            os.utime(destination)
+            return destination, None
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            # the same variant requested twice while rendering shares one render
+            future = self._pending.get(key)
+            if future is None:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                future = self._pool.submit(_render_variant, source, destination, width, height, VARIANT_FORMATS[fmt])
+                future.add_done_callback(lambda done: self._rendered(key, done))
+                self._pending[key] = future
+
+        return destination, future
+
+    def _rendered(self, key: str, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+
+            if self._size is None:
+                self._size = self._scan_size()
+            self._size += future.result()
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for directory in os.scandir(self.folder):
+            if directory.is_dir():
+                for entry in os.scandir(directory.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        yield entry
+
+    def _scan_size(self) -> int:
+        if not os.path.isdir(self.folder):
+            return 0
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def _evict(self) -> None:
+        """Deletes least recently used variants until the cache is back under 90% of its limit"""
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._files()))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+
+variants = VariantCache()
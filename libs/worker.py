@@ -0,0 +1,104 @@
+"""
+libs.worker
+
+Background task that runs a function inside the app context every `interval`
+seconds, or right away when woken up. The thread is started lazily on the first
+`wake()`/`start()` so each worker process (after a fork) owns its own thread.
+
+`LazyProcessPool` follows the same rule for CPU bound work kept off the GIL. When
+one of its processes dies (OOM kill, segfault) the executor is broken for good:
+it is dropped, and the next call gets a new one.
+"""
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+
+class LazyProcessPool:
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, function: Callable, *args) -> Future:
+        executor = self._get_executor()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            # nothing ran yet, so it is safe to run it on a new executor
+            self._discard(executor)
+            executor = self._get_executor()
+            future = executor.submit(function, *args)
+
+        # the futures of a broken executor fail with BrokenProcessPool, the caller decides what to answer
+        future.add_done_callback(lambda done: self._discard_if_broken(executor, done))
+        return future
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # created lazily, and again after a fork, so every worker process owns its pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # a broken executor already stopped its processes, and another thread may have replaced it
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _discard_if_broken(self, executor: ProcessPoolExecutor, future: Future) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard(executor)
+
+
+class PeriodicTask:
+    def __init__(self, name: str, function: Callable[[], object], interval: float = 60):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.app = None
+        self._event = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, interval: float = None) -> None:
+        self.app = app
+        if interval is not None:
+            self.interval = interval
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def wake(self) -> None:
+        # not bound to an app: the task is driven from elsewhere (e.g. a CLI command)
+        if self.app is None:
+            return
+
+        self.start()
+        self._event.set()
+
+    def run_once(self) -> object:
+        with self.app.app_context():
+            return self.function()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                self.app.logger.exception("background task '%s' failed", self.name)
+
+            self._event.wait(self.interval)
+            self._event.clear()
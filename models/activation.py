@@ -2,13 +2,22 @@
 from time import time
 from uuid import uuid4
 
-from libs.db import db
+from flask import current_app
+
+from libs.db import db, retry_on_lock, IN_BATCH_SIZE
+from libs.worker import PeriodicTask
 
 ACTIVATION_EXPIRATION_DELTA = 1800  # 3 MINUTES
 
 
 class ActivationModel(db.Model):
     __tablename__ = "activations"
+    __table_args__ = (
+        # most_recent_activation: WHERE user_id = ? ORDER BY expire_at DESC LIMIT 1
+        db.Index("ix_activations_user_id_expire_at", "user_id", "expire_at"),
+        # the reaper: WHERE activated IS 0 AND expire_at < ?
+        db.Index("ix_activations_activated_expire_at", "activated", "expire_at"),
+    )
 
     id = db.Column(db.String(50), primary_key=True)
     expire_at = db.Column(db.Integer, nullable=False)
@@ -29,6 +38,33 @@ class ActivationModel(db.Model):
     def find_by_id(cls, _id: str) -> "ActivationModel":
         return cls.query.filter_by(id=_id).first()
 
+    @classmethod
+    def reap_expired(cls, batch_size: int = None, retention: int = None) -> int:
+        """
+        Deletes activations that expired unconfirmed more than `retention` seconds ago, a batch per transaction
+        so the table is never locked for long. Returns how many were deleted.
+        """
+        # the ids of a batch go into one IN (...)
+        batch_size = min(batch_size or current_app.config.get("ACTIVATION_REAPER_BATCH_SIZE", 500), IN_BATCH_SIZE)
+        if retention is None:
+            retention = current_app.config.get("ACTIVATION_RETENTION", 24 * 3600)
+        cutoff = int(time()) - retention
+
+        reaped = 0
+        while True:
+            ids = [
+                _id for _id, in db.session.query(cls.id)
+                .filter(cls.activated.is_(False), cls.expire_at < cutoff)
+                .limit(batch_size)
+            ]
+            if ids:
+                cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+                reaped += len(ids)
+
+            if len(ids) < batch_size:
+                return reaped
+
     @property
     def expired(self) -> bool:
         return time() > self.expire_at
@@ -38,10 +74,15 @@ class ActivationModel(db.Model):
             self.expire_at = int(time())
             self.save_to_db()
 
+    @retry_on_lock
     def save_to_db(self) -> None:
         db.session.add(self)
         db.session.commit()
 
+    @retry_on_lock
     def delete_from_db(self) -> None:
         db.session.delete(self)
         db.session.commit()
+
+
+reaper = PeriodicTask("activation-reaper", ActivationModel.reap_expired, 3600)
@@ -0,0 +1,11 @@
+from libs.db import db
+
+
+class TokenBlocklistModel(db.Model):
+    __tablename__ = "token_blocklist"
+    # workers sync by `id > last id seen`, a pruned id handed out again would be skipped
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expire_at = db.Column(db.Integer, nullable=False, index=True)
@@ -0,0 +1,145 @@
+import mimetypes
+import os
+import re
+from time import time
+from typing import Dict, List, Tuple
+
+from libs import im
+from libs.db import db, retry_on_lock, IN_BATCH_SIZE
+from models.user import UserModel
+
+USER_FOLDER = re.compile(r"^user_(\d+)$")
+
+
+class ImageModel(db.Model):
+    __tablename__ = "images"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "filename", name="uq_images_user_id_filename"),
+        # serves the per-user keyset pagination: WHERE user_id = ? AND id > ? ORDER BY id
+        db.Index("ix_images_user_id_id", "user_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(50), nullable=False)
+    hash = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    created_at = db.Column(db.Integer, nullable=False)
+
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        "users.id"), nullable=False)
+    user = db.relationship("UserModel", viewonly=True)
+
+    @classmethod
+    def from_file(cls, user_id: int, path: str) -> "ImageModel":
+        """Takes the owner and the full path of a just stored image and returns its (unsaved) metadata"""
+        # not the file's mtime: the file is a hard link to a blob that may have been uploaded long ago
+        return cls(user_id=user_id, created_at=int(time()), **cls.describe(path))
+
+    @classmethod
+    def describe(cls, path: str) -> dict:
+        """Returns the metadata columns of an image file, all but `created_at`"""
+        stat = os.stat(path)
+        width, height = im.get_image_size(path)
+        filename = im.get_basename(path)
+        return {
+            "filename": filename,
+            "size": stat.st_size,
+            "content_type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            "hash": im.get_image_hash(path),
+            "width": width,
+            "height": height,
+        }
+
+    @classmethod
+    def find_by_filename(cls, user_id: int, filename: str) -> "ImageModel":
+        return cls.query.filter_by(user_id=user_id, filename=filename).first()
+
+    @classmethod
+    def find_page(cls, user_id: int, limit: int, after: int = None) -> List["ImageModel"]:
+        query = cls.query.filter_by(user_id=user_id)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def reconcile(cls, root: str) -> Tuple[int, int, int]:
+        """
+        Rebuilds the index from the `user_<id>` folders under `root`: one listing per folder and a few bulk
+        statements per user. Returns how many rows were (inserted, updated, deleted).
+        """
+        on_disk = {}
+        for entry in os.scandir(root):
+            match = USER_FOLDER.match(entry.name)
+            if match and entry.is_dir():
+                on_disk[int(match.group(1))] = entry.path
+
+        # folders left behind by deleted users have nobody to belong to
+        ids = list(on_disk)
+        users = set()
+        for start in range(0, len(ids), IN_BATCH_SIZE):
+            chunk = ids[start:start + IN_BATCH_SIZE]
+            users.update(user_id for user_id, in db.session.query(UserModel.id).filter(UserModel.id.in_(chunk)))
+
+        inserted = updated = deleted = 0
+        for user_id in sorted(users):
+            files = cls._scan_folder(on_disk[user_id])
+            indexed = {
+                image.filename: image
+                for image in cls.query.filter_by(user_id=user_id).with_entities(cls.id, cls.filename, cls.size, cls.hash)
+            }
+
+            inserts, updates = [], []
+            for filename, path in files.items():
+                current = indexed.pop(filename, None)
+                if current is None:
+                    # when it was uploaded is lost, the mtime is the best guess left
+                    created_at = int(os.path.getmtime(path))
+                    inserts.append({**cls.describe(path), "user_id": user_id, "created_at": created_at})
+                # the hash comes from the sidecar written at upload, the image itself is only read when it changed
+                elif (current.size, current.hash) != (os.path.getsize(path), im.get_image_hash(path)):
+                    updates.append({**cls.describe(path), "id": current.id})
+
+            stale = [image.id for image in indexed.values()]
+            try:
+                db.session.bulk_insert_mappings(cls, inserts)
+                db.session.bulk_update_mappings(cls, updates)
+                for start in range(0, len(stale), IN_BATCH_SIZE):
+                    cls.query.filter(cls.id.in_(stale[start:start + IN_BATCH_SIZE])).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            inserted += len(inserts)
+            updated += len(updates)
+            deleted += len(stale)
+
+        # a whole folder gone takes its rows with it
+        for user_id, in db.session.query(cls.user_id).distinct().all():
+            if user_id not in users:
+                deleted += cls.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        db.session.commit()
+
+        return inserted, updated, deleted
+
+    @classmethod
+    def _scan_folder(cls, folder: str) -> Dict[str, str]:
+        # hash sidecars are hidden files and never pass `is_filename_safe`
+        return {
+            entry.name: entry.path
+            for entry in os.scandir(folder)
+            if entry.is_file() and im.is_filename_safe(entry.name)
+        }
+
+    @retry_on_lock
+    def save_to_db(self) -> None:
+        db.session.add(self)
+        db.session.commit()
+
+    @retry_on_lock
+    def delete_from_db(self) -> None:
+        db.session.delete(self)
+        db.session.commit()
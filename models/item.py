@@ -1,6 +1,7 @@
-from typing import List
+from typing import Dict, Iterator, List
 
-from libs.db import db
+from libs.db import db, retry_on_lock, IN_BATCH_SIZE
+from libs.cache import cache
 
 
 class ItemModel(db.Model):
@@ -15,17 +16,67 @@ class ItemModel(db.Model):
     store = db.relationship("StoreModel")
 
     @classmethod
-    def find_by_name(cls, name: str) -> "ItemModel":
-        return cls.query.filter_by(name=name).first()
+    def find_by_name(cls, name: str, fresh: bool = False) -> "ItemModel":
+        """With `fresh` the row is read from the database, not the cache, for a lookup followed by a write"""
+        if fresh:
+            return cls.query.filter_by(name=name).populate_existing().first()
+        return cache.get_or_load(cls, f"name:{name}", lambda: cls.query.filter_by(name=name).first())
 
     @classmethod
     def find_all(cls) -> List["ItemModel"]:
-        return cls.query.all()
+        return cache.get_or_load(cls, "all", cls.query.all)
 
+    @classmethod
+    def find_page(cls, limit: int, after: int = None) -> List["ItemModel"]:
+        query = cls.query
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def find_page_rows(cls, columns: list, limit: int, after: int = None) -> list:
+        """Same page as `find_page`, as tuples of the given columns (`id` among them) instead of instances"""
+        query = db.session.query(*columns)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def iter_all(cls, batch_size: int = 500) -> Iterator["ItemModel"]:
+        return cls.query.order_by(cls.id).yield_per(batch_size)
+
+    @classmethod
+    def find_ids_by_names(cls, names: List[str]) -> Dict[str, int]:
+        """Returns {name: id} for the names that already exist, one IN query per batch of names"""
+        found = {}
+        for start in range(0, len(names), IN_BATCH_SIZE):
+            chunk = names[start:start + IN_BATCH_SIZE]
+            found.update(db.session.query(cls.name, cls.id).filter(cls.name.in_(chunk)))
+        return found
+
+    @classmethod
+    def bulk_save(cls, inserts: List[dict], updates: List[dict]) -> None:
+        """Inserts and updates (mappings with an `id`) many items in a single transaction"""
+        try:
+            db.session.bulk_insert_mappings(cls, inserts)
+            db.session.bulk_update_mappings(cls, updates)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            cache.invalidate(cls, "all", *(f"name:{row['name']}" for row in inserts + updates))
+
+    @retry_on_lock
     def save_to_db(self) -> None:
+        name = self.name
         db.session.add(self)
         db.session.commit()
+        cache.invalidate(ItemModel, f"name:{name}", "all")
 
+    @retry_on_lock
     def delete_from_db(self) -> None:
+        name = self.name
         db.session.delete(self)
         db.session.commit()
+        cache.invalidate(ItemModel, f"name:{name}", "all")
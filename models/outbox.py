@@ -0,0 +1,114 @@
+from time import time
+from typing import List
+
+from flask import current_app
+
+from libs.db import db, retry_on_lock
+from libs.mg import Mailgun, MailgunException
+from libs.worker import PeriodicTask
+
+EMAIL_PENDING = "pending"
+EMAIL_SENDING = "sending"
+EMAIL_SENT = "sent"
+EMAIL_FAILED = "failed"
+
+SENDING_LEASE = 120  # 2 MINUTES, a claimed email is retried after this if its sender died
+RETRY_BACKOFF = 30  # doubled on every failed attempt
+MAX_RETRY_BACKOFF = 3600  # 1 HOUR
+
+
+class OutboxModel(db.Model):
+    __tablename__ = "email_outbox"
+    __table_args__ = (db.Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    next_attempt_at = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.String(255))
+
+    def __init__(self, recipient: str, subject: str, text: str, html: str, **kwargs):
+        super().__init__(**kwargs)
+        self.recipient = recipient
+        self.subject = subject
+        self.text = text
+        self.html = html
+        self.status = EMAIL_PENDING
+        self.attempts = 0
+        self.created_at = self.next_attempt_at = int(time())
+
+    @classmethod
+    def find_due(cls, limit: int) -> List["OutboxModel"]:
+        return (
+            cls.query.filter(cls.status.in_((EMAIL_PENDING, EMAIL_SENDING)), cls.next_attempt_at <= int(time()))
+            .order_by(cls.next_attempt_at)
+            .limit(limit)
+            .all()
+        )
+
+    @classmethod
+    def dispatch_due(cls, batch_size: int = None, max_attempts: int = None) -> int:
+        """Sends every due email, a batch at a time, and returns how many were delivered"""
+        batch_size = batch_size or current_app.config.get("EMAIL_OUTBOX_BATCH_SIZE", 50)
+        max_attempts = max_attempts or current_app.config.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+        sent = 0
+        while True:
+            batch = cls.find_due(batch_size)
+            for email in batch:
+                if email.claim() and email.deliver(max_attempts):
+                    sent += 1
+
+            if len(batch) < batch_size:
+                return sent
+
+    def claim(self) -> bool:
+        """
+        Takes a lease on the email so no other process sends it at the same time.
+        The update only matches while `next_attempt_at` is unchanged, so exactly one claimer wins.
+        """
+        claimed = OutboxModel.query.filter_by(id=self.id, next_attempt_at=self.next_attempt_at).update(
+            {
+                "status": EMAIL_SENDING,
+                "attempts": OutboxModel.attempts + 1,
+                "next_attempt_at": int(time()) + SENDING_LEASE
+            },
+            synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def deliver(self, max_attempts: int) -> bool:
+        try:
+            Mailgun.send_email(self.recipient, self.subject, self.text, self.html)
+        except MailgunException as err:
+            self.last_error = str(err)[:255]
+            if self.attempts >= max_attempts:
+                self.status = EMAIL_FAILED
+            else:
+                self.status = EMAIL_PENDING
+                self.next_attempt_at = int(time()) + min(RETRY_BACKOFF * 2 ** (self.attempts - 1), MAX_RETRY_BACKOFF)
+            self.save_to_db()
+            return False
+
+        self.status = EMAIL_SENT
+        self.last_error = None
+        self.save_to_db()
+        return True
+
+    @retry_on_lock
+    def save_to_db(self) -> None:
+        db.session.add(self)
+        db.session.commit()
+
+    @retry_on_lock
+    def delete_from_db(self) -> None:
+        db.session.delete(self)
+        db.session.commit()
+
+
+dispatcher = PeriodicTask("email-outbox", OutboxModel.dispatch_due)
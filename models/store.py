@@ -1,7 +1,9 @@
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Set
 
 from libs.i18n import get_text
-from libs.db import db
+from libs.db import db, retry_on_lock, IN_BATCH_SIZE
+from libs.cache import cache
+from models.item import ItemModel
 
 
 class StoreModel(db.Model):
@@ -12,18 +14,101 @@ class StoreModel(db.Model):
 
     items = db.relationship("ItemModel", lazy="dynamic", viewonly=True)
 
+    @property
+    def item_list(self) -> List["ItemModel"]:
+        """Items preloaded by `load_items`, falls back to querying the dynamic relationship"""
+        preloaded = self.__dict__.get("_preloaded_items")
+        if preloaded is not None:
+            return preloaded
+        return self.items.all()
+
     @classmethod
-    def find_by_name(cls, name: str) -> "StoreModel":
-        return cls.query.filter_by(name=name).first()
+    def find_by_name(cls, name: str, fresh: bool = False) -> "StoreModel":
+        """With `fresh` the row is read from the database, not the cache, for a lookup followed by a write"""
+        if fresh:
+            return cls.query.filter_by(name=name).populate_existing().first()
+        return cache.get_or_load(cls, f"name:{name}", lambda: cls.query.filter_by(name=name).first())
 
     @classmethod
     def find_all(cls) -> List["StoreModel"]:
-        return cls.query.all()
+        return cache.get_or_load(cls, "all", cls.query.all)
+
+    @classmethod
+    def find_existing_ids(cls, ids: Iterable[int]) -> Set[int]:
+        """Returns which of the given ids belong to a store, one IN query per batch of ids"""
+        ids = list(ids)
+        found = set()
+        for start in range(0, len(ids), IN_BATCH_SIZE):
+            chunk = ids[start:start + IN_BATCH_SIZE]
+            found.update(_id for _id, in db.session.query(cls.id).filter(cls.id.in_(chunk)))
+        return found
+
+    @classmethod
+    def find_page(cls, limit: int, after: int = None) -> List["StoreModel"]:
+        query = cls.query
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def find_page_rows(cls, columns: list, limit: int, after: int = None) -> list:
+        """Same page as `find_page`, as tuples of the given columns (`id` among them) instead of instances"""
+        query = db.session.query(*columns)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def iter_all(cls, batch_size: int = 500) -> Iterator["StoreModel"]:
+        # walk the table in keyset batches so each batch can preload its items with one query
+        after = None
+        while True:
+            stores = cls.load_items(cls.find_page(batch_size, after))
+            yield from stores
+            if len(stores) < batch_size:
+                return
+            after = stores[-1].id
+
+    @classmethod
+    def load_items(cls, stores: List["StoreModel"]) -> List["StoreModel"]:
+        """Loads the items of all given stores with a single IN query, avoiding one query per store"""
+        if not stores:
+            return stores
+
+        grouped = {store.id: [] for store in stores}
+        query = ItemModel.query.filter(ItemModel.store_id.in_(list(grouped)))
+        for item in query.order_by(ItemModel.id):
+            grouped[item.store_id].append(item)
+
+        for store in stores:
+            store._preloaded_items = grouped[store.id]
+
+        return stores
+
+    @classmethod
+    def find_item_rows(cls, store_ids: List[int], columns: list) -> Dict[int, list]:
+        """Returns {store id: item rows} with the given item columns, for all given stores with a single IN query"""
+        grouped = {store_id: [] for store_id in store_ids}
+        if not grouped:
+            return grouped
+
+        # the store id goes last, where it doesn't shift the requested columns
+        query = db.session.query(*columns, ItemModel.store_id).filter(ItemModel.store_id.in_(list(grouped)))
+        for row in query.order_by(ItemModel.id):
+            grouped[row[-1]].append(row)
+
+        return grouped
 
+    @retry_on_lock
     def save_to_db(self) -> None:
+        name = self.name
         db.session.add(self)
         db.session.commit()
+        cache.invalidate(StoreModel, f"name:{name}", "all")
 
+    @retry_on_lock
     def delete_from_db(self) -> None:
+        name = self.name
         db.session.delete(self)
         db.session.commit()
+        cache.invalidate(StoreModel, f"name:{name}", "all")
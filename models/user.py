@@ -1,10 +1,15 @@
+import os
+import re
+
 from flask import request, url_for
-from requests import Response
 
-from libs.db import db
-from libs.bc import bc
+from libs.db import db, retry_on_lock, IN_BATCH_SIZE
+from libs.bc import hasher, HasherBusyException
 from libs.mg import Mailgun
 from models.activation import ActivationModel
+from models.outbox import OutboxModel, dispatcher
+
+AVATAR_NAME = re.compile(r"^user_(\d+)\.\w+$")
 
 
 class UserModel(db.Model):
@@ -14,6 +19,9 @@ class UserModel(db.Model):
     username = db.Column(db.String(20), nullable=False, unique=True)
     email = db.Column(db.String(255), nullable=False, unique=True)
     password = db.Column(db.String(128), nullable=False)
+    avatar = db.Column(db.String(255))  # file name inside the avatars folder, set on upload
+    # copy of "has a confirmed activation", so login never has to look the activations up
+    activated = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     activation = db.relationship(
         "ActivationModel", lazy="dynamic", cascade="all, delete-orphan")
@@ -22,6 +30,20 @@ class UserModel(db.Model):
     def most_recent_activation(self) -> "ActivationModel":
         return self.activation.order_by(db.desc(ActivationModel.expire_at)).first()
 
+    @property
+    def is_activated(self) -> bool:
+        """Takes the denormalized flag, falling back to the activations (and fixing the flag) for older rows"""
+        if self.activated:
+            return True
+
+        activation = self.most_recent_activation
+        if activation and activation.activated:
+            self.activated = True
+            self.save_to_db()
+            return True
+
+        return False
+
     @classmethod
     def find_by_username(cls, username: str) -> "UserModel":
         return cls.query.filter_by(username=username).first()
@@ -34,7 +56,30 @@ class UserModel(db.Model):
     def find_by_id(cls, _id: int) -> "UserModel":
         return cls.query.filter_by(id=_id).first()
 
-    def send_confirmation_email(self) -> Response:
+    @classmethod
+    def index_avatars(cls, folder: str) -> int:
+        """Records the avatar of every user from a single listing of the avatars folder, returns how many were set"""
+        avatars = {}
+        for entry in os.scandir(folder):
+            match = AVATAR_NAME.match(entry.name)
+            if match and entry.is_file():
+                avatars[int(match.group(1))] = entry.name
+
+        ids = list(avatars)
+        indexed = 0
+        for start in range(0, len(ids), IN_BATCH_SIZE):
+            chunk = ids[start:start + IN_BATCH_SIZE]
+            for user in cls.query.filter(cls.id.in_(chunk), cls.avatar.is_(None)):
+                user.avatar = avatars[user.id]
+                indexed += 1
+
+        db.session.commit()
+        return indexed
+
+    def send_confirmation_email(self) -> "OutboxModel":
+        """Queues the activation email in the outbox, the dispatcher delivers it in the background"""
+        Mailgun.check_config()
+
         link = request.url_root[:-1] + url_for(
             "activation", activation_id=self.most_recent_activation.id
         )
@@ -42,15 +87,33 @@ class UserModel(db.Model):
         text = f"Please click the link to activate your registration: {link}"
         html = f'<html>Please click the link to activate your registration: <a href="{link}">Activation Link</a></html>'
 
-        return Mailgun.send_email(self.email, subject, text, html)
+        email = OutboxModel(self.email, subject, text, html)
+        email.save_to_db()
+        dispatcher.wake()
 
+        return email
+
+    @retry_on_lock
     def save_to_db(self) -> None:
         db.session.add(self)
         db.session.commit()
 
+    @retry_on_lock
     def delete_from_db(self) -> None:
         db.session.delete(self)
         db.session.commit()
 
     def verify_password(self, password: str) -> bool:
-        return bc.check_password_hash(self.password, password)
+        return hasher.check_password_hash(self.password, password)
+
+    def rehash_password(self, password: str) -> None:
+        """Rehashes the (already verified) password if it was stored with a lower work factor, best effort"""
+        if not hasher.needs_rehash(self.password):
+            return
+
+        try:
+            self.password = hasher.generate_password_hash(password)
+        except HasherBusyException:
+            return
+
+        self.save_to_db()
@@ -27,6 +27,7 @@ class Activation(Resource):
             return {"message": get_text("activation_activated")}, 400
 
         activation.activated = True
+        activation.user.activated = True
         activation.save_to_db()
 
         headers = {"Content-Type": "text/html"}
@@ -58,6 +59,9 @@ class ActivationByUser(Resource):
         if not user:
             return {"message": get_text("user_not_found")}, 404
 
+        if user.activated:
+            return {"message": get_text("activation_activated")}, 400
+
         try:
             activation = user.most_recent_activation
             if activation:
@@ -0,0 +1,51 @@
+from flask import Response, request, stream_with_context
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+
+from libs.i18n import get_text
+from libs.export import EXPORT_FORMATS, export_rows, gzip_chunks
+from libs.ndjson import NDJSON_MIMETYPE
+from models.item import ItemModel
+from models.store import StoreModel
+
+EXPORT_MODELS = {"items": ItemModel, "stores": StoreModel}
+EXPORT_MIMETYPES = {"csv": "text/csv", "ndjson": NDJSON_MIMETYPE}
+
+
+class Export(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls, table: str):
+        """
+        Streams a whole table as CSV or NDJSON (`?format=`), optionally gzipped on the fly (`?gzip=1`).
+        Pass `?after=<id>` with the last exported id to resume an interrupted export, CSV comes without its header.
+        """
+        model = EXPORT_MODELS.get(table)
+        if not model:
+            return {"message": get_text("export_table_not_found").format(table)}, 404
+
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            return {"message": get_text("export_invalid_format").format(fmt)}, 400
+
+        after = request.args.get("after")
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                return {"message": get_text("export_invalid_after")}, 400
+
+        chunks = export_rows(model, fmt, after)
+        mimetype = EXPORT_MIMETYPES[fmt]
+        filename = f"{table}.{fmt}"
+
+        if request.args.get("gzip") in ("1", "true"):
+            chunks = gzip_chunks(chunks)
+            mimetype = "application/gzip"
+            filename += ".gz"
+
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
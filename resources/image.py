@@ -1,16 +1,22 @@
-import os
 import traceback
 
 from flask_restful import Resource
 from flask_uploads import UploadNotAllowed
-from flask import request, send_file
+from flask import request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from libs import im
 from libs.i18n import get_text
-from schemas.image import ImageSchema
+from libs.cursor import CursorException, parse_page_args, next_cursor
+from libs.variants import variants, VariantException
+from models.image import ImageModel
+from models.user import UserModel
+from schemas.image import ImageSchema, ImageMetadataSchema
+
+AVATAR_FOLDER = "avatars"
 
 image_schema = ImageSchema()
+images_metadata_schema = ImageMetadataSchema(many=True)
 
 
 class ImageUpload(Resource):
@@ -28,6 +34,9 @@ class ImageUpload(Resource):
         try:
             image_path = im.save_image(data["image"], folder)
             basename = im.get_basename(image_path)
+            full_path = im.get_path(image_path)
+            ImageModel.from_file(user_id, full_path).save_to_db()
+            variants.pregenerate(full_path)
 
             return {"message": get_text("image_uploaded").format(basename)}, 201
         except UploadNotAllowed:
@@ -35,6 +44,25 @@ class ImageUpload(Resource):
             return {"message": get_text("image_extension_not_allowed").format(extension)}, 400
 
 
+class ImageList(Resource):
+    @classmethod
+    @jwt_required()
+    def get(cls):
+        """
+        Lists the logged in user's images from the metadata index, a page at a time (`?limit=&after=`).
+        """
+        try:
+            limit, after = parse_page_args(request.args)
+        except CursorException as err:
+            return {"message": str(err)}, 400
+
+        # fetch one extra row so we know whether there is a next page
+        images = ImageModel.find_page(get_jwt_identity(), limit + 1, after)
+        cursor = next_cursor(images, limit)
+
+        return {"images": images_metadata_schema.dump(images), "next": cursor}, 200
+
+
 class Image(Resource):
     @classmethod
     @jwt_required()
@@ -49,9 +77,32 @@ class Image(Resource):
             return {"message": get_text("image_illegal_file_name").format(filename)}, 400
 
         try:
-            return send_file(im.get_path(filename, folder))
+            variant = cls.parse_variant()
+        except VariantException as err:
+            return {"message": str(err)}, 400
+
+        try:
+            image_path = im.get_path(filename, folder)
+            if variant:
+                return cls.send_variant(variants.get(image_path, *variant))
+            return im.send_image(image_path)
         except FileNotFoundError:
             return {"message": get_text("image_not_found").format(filename)}, 404
+        except VariantException as err:
+            return {"message": str(err)}, 400
+
+    @classmethod
+    def parse_variant(cls):
+        """Returns the requested (width, height, format) variant, None for the original image"""
+        variant = variants.parse_args(request.args)
+        if variant and not variants.available:
+            raise VariantException(get_text("image_variants_unavailable"))
+        return variant
+
+    @classmethod
+    def send_variant(cls, variant_path: str):
+        # variants are named after a hash of their source content and parameters, which makes a strong ETag
+        return im.send_image(variant_path, etag=im.get_basename(variant_path).split(".")[0])
 
     @classmethod
     @jwt_required()
@@ -63,7 +114,10 @@ class Image(Resource):
             return {"message": get_text("image_illegal_file_name").format(filename)}, 400
 
         try:
-            os.remove(im.get_path(filename, folder))
+            im.delete_image(im.get_path(filename, folder))
+            image = ImageModel.find_by_filename(user_id, filename)
+            if image:
+                image.delete_from_db()
             return {"message": get_text("image_deleted").format(filename)}, 200
         except FileNotFoundError:
             return {"message": get_text("image_not_found").format(filename)}, 404
@@ -84,12 +138,17 @@ class AvatarUpload(Resource):
         data = image_schema.load(request.files)
         user_id = get_jwt_identity()
         filename = f"user_{user_id}"
-        folder = "avatars"
-        avatar_path = im.find_image_any_format(filename, folder)
+        folder = AVATAR_FOLDER
+
+        user = UserModel.find_by_id(user_id)
+        if not user:
+            return {"message": get_text("user_not_found")}, 404
 
-        if avatar_path:
+        if user.avatar:
             try:
-                os.remove(avatar_path)
+                im.delete_image(im.get_path(user.avatar, folder))
+            except FileNotFoundError:
+                pass
             except:
                 return {"message": get_text("avatar_delete_error").format(filename)}, 500
 
@@ -98,6 +157,11 @@ class AvatarUpload(Resource):
             name = filename + ext
             avatar_path = im.save_image(data["image"], folder, name)
             basename = im.get_basename(avatar_path)
+            variants.pregenerate(im.get_path(avatar_path))
+
+            # record where the avatar lives so fetching it never probes the disk
+            user.avatar = basename
+            user.save_to_db()
 
             return {"message": get_text("avatar_uploaded").format(basename)}, 200
         except UploadNotAllowed:
@@ -109,11 +173,22 @@ class Avatar(Resource):
     @classmethod
     @jwt_required()
     def get(cls, user_id: int):
-        filename = f"user_{user_id}"
-        folder = "avatars"
-        avatar = im.find_image_any_format(filename, folder)
+        try:
+            variant = Image.parse_variant()
+        except VariantException as err:
+            return {"message": str(err)}, 400
 
-        if avatar:
-            return send_file(avatar)
+        user = UserModel.find_by_id(user_id)
+
+        if user and user.avatar:
+            avatar = im.get_path(user.avatar, AVATAR_FOLDER)
+            try:
+                if variant:
+                    return Image.send_variant(variants.get(avatar, *variant))
+                return im.send_image(avatar)
+            except FileNotFoundError:
+                pass
+            except VariantException as err:
+                return {"message": str(err)}, 400
 
         return {"message": get_text("avatar_not_found").format(user_id)}, 404
@@ -1,13 +1,23 @@
-from flask import request
+import json
+import traceback
+
+from flask import current_app, request
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required
+from marshmallow import ValidationError
 
 from libs.i18n import get_text
+from libs.cursor import CursorException, parse_page_args, next_cursor
+from libs.ndjson import NDJSON_MIMETYPE, wants_ndjson, stream_ndjson
 from models.item import ItemModel
-from schemas.item import ItemSchema
+from models.store import StoreModel
+from schemas.item import ItemSchema, ItemBulkSchema
+
+BULK_MAX_ROWS = 10000
 
 item_schema = ItemSchema()
 items_schema = ItemSchema(many=True)
+items_bulk_schema = ItemBulkSchema(many=True)
 
 
 class Item(Resource):
@@ -23,7 +33,7 @@ class Item(Resource):
     @classmethod
     @jwt_required()
     def post(cls, name: str):
-        if ItemModel.find_by_name(name):
+        if ItemModel.find_by_name(name, fresh=True):
             return {"message": get_text("item_name_exists").format(name)}, 400
 
         item_json = request.get_json()
@@ -41,7 +51,7 @@ class Item(Resource):
     @classmethod
     @jwt_required()
     def delete(cls, name: str):
-        item = ItemModel.find_by_name(name)
+        item = ItemModel.find_by_name(name, fresh=True)
 
         if item:
             item.delete_from_db()
@@ -53,7 +63,7 @@ class Item(Resource):
     def put(cls, name: str):
         item_json = request.get_json()
 
-        item = ItemModel.find_by_name(name)
+        item = ItemModel.find_by_name(name, fresh=True)
 
         if item:
             item.price = item_json["price"]
@@ -70,4 +80,107 @@ class ItemList(Resource):
     @classmethod
     @jwt_required()
     def get(cls):
-        return {"items": items_schema.dump(ItemModel.find_all())}, 200
+        if wants_ndjson():
+            return stream_ndjson(ItemModel.iter_all(), item_schema)
+
+        try:
+            limit, after = parse_page_args(request.args)
+        except CursorException as err:
+            return {"message": str(err)}, 400
+
+        # fetch one extra row so we know whether there is a next page
+        if current_app.config.get("SCHEMA_FAST_DUMP", True):
+            items = ItemModel.find_page_rows(items_schema.fast_columns, limit + 1, after)
+            cursor = next_cursor(items, limit)
+            return {"items": items_schema.fast_dump(items), "next": cursor}, 200
+
+        items = ItemModel.find_page(limit + 1, after)
+        cursor = next_cursor(items, limit)
+
+        return {"items": items_schema.dump(items), "next": cursor}, 200
+
+
+class ItemBulk(Resource):
+    @classmethod
+    @jwt_required()
+    def post(cls):
+        """
+        Create many items at once from a JSON list (or {"items": [...]}) or NDJSON body.
+        With `?mode=upsert` existing items get their price and store updated, otherwise they are reported as conflicts.
+        Everything valid is written in a single transaction and the response holds one result per row.
+        """
+        mode = request.args.get("mode", "insert")
+        if mode not in ("insert", "upsert"):
+            return {"message": get_text("item_bulk_invalid_mode").format(mode)}, 400
+
+        try:
+            rows = cls._parse_rows()
+        except ValueError:
+            return {"message": get_text("item_bulk_invalid_body")}, 400
+
+        if len(rows) > BULK_MAX_ROWS:
+            return {"message": get_text("item_bulk_too_many_rows").format(BULK_MAX_ROWS)}, 413
+
+        try:
+            loaded = items_bulk_schema.load(rows)
+            errors = {}
+        except ValidationError as err:
+            loaded, errors = err.valid_data, err.messages
+
+        # name -> row index of every valid row, duplicated names inside the request are rejected
+        candidates = {}
+        for index in range(len(rows)):
+            if index in errors:
+                continue
+            name = loaded[index]["name"]
+            if name in candidates:
+                errors[index] = {"name": [get_text("item_bulk_duplicate_name").format(name)]}
+                continue
+            candidates[name] = index
+
+        existing = ItemModel.find_ids_by_names(list(candidates))
+        stores = StoreModel.find_existing_ids({loaded[index]["store_id"] for index in candidates.values()})
+
+        statuses = {}
+        inserts = []
+        updates = []
+        for name, index in candidates.items():
+            row = loaded[index]
+            if row["store_id"] not in stores:
+                errors[index] = {"store_id": [get_text("store_not_found")]}
+            elif name not in existing:
+                inserts.append(row)
+                statuses[index] = "created"
+            elif mode == "upsert":
+                updates.append({**row, "id": existing[name]})
+                statuses[index] = "updated"
+            else:
+                errors[index] = {"name": [get_text("item_name_exists").format(name)]}
+
+        try:
+            ItemModel.bulk_save(inserts, updates)
+        except Exception:
+            traceback.print_exc()
+            return {"message": get_text("item_insert_error")}, 500
+
+        results = []
+        for index in range(len(rows)):
+            if index in errors:
+                results.append({"index": index, "status": "error", "errors": errors[index]})
+            else:
+                results.append({"index": index, "status": statuses[index]})
+
+        return {"created": len(inserts), "updated": len(updates), "errors": len(errors), "results": results}, 200
+
+    @classmethod
+    def _parse_rows(cls) -> list:
+        if request.mimetype == NDJSON_MIMETYPE:
+            return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get("items")
+        if not isinstance(payload, list):
+            raise ValueError("expected a list of items")
+
+        return payload
@@ -1,6 +1,9 @@
+from flask import current_app, request
 from flask_restful import Resource
 
 from libs.i18n import get_text
+from libs.cursor import CursorException, parse_page_args, next_cursor
+from libs.ndjson import wants_ndjson, stream_ndjson
 from models.store import StoreModel
 from schemas.store import StoreSchema
 
@@ -18,7 +21,7 @@ class Store(Resource):
 
     @classmethod
     def post(cls, name: str):
-        if StoreModel.find_by_name(name):
+        if StoreModel.find_by_name(name, fresh=True):
             return {"message": get_text("store_name_exists").format(name)}, 400
 
         store = StoreModel(name=name)
@@ -31,7 +34,7 @@ class Store(Resource):
 
     @classmethod
     def delete(cls, name: str):
-        store = StoreModel.find_by_name(name)
+        store = StoreModel.find_by_name(name, fresh=True)
         if store:
             store.delete_from_db()
             return {"message": get_text("store_deleted")}, 200
@@ -42,4 +45,23 @@ class Store(Resource):
 class StoreList(Resource):
     @classmethod
     def get(cls):
-        return {"stores": stores_schema.dump(StoreModel.find_all())}, 200
+        if wants_ndjson():
+            return stream_ndjson(StoreModel.iter_all(), store_schema)
+
+        try:
+            limit, after = parse_page_args(request.args)
+        except CursorException as err:
+            return {"message": str(err)}, 400
+
+        # fetch one extra row so we know whether there is a next page
+        if current_app.config.get("SCHEMA_FAST_DUMP", True):
+            stores = StoreModel.find_page_rows(stores_schema.fast_columns, limit + 1, after)
+            cursor = next_cursor(stores, limit)
+            items = StoreModel.find_item_rows([store.id for store in stores], stores_schema.item_columns)
+            return {"stores": stores_schema.fast_dump(stores, items), "next": cursor}, 200
+
+        stores = StoreModel.find_page(limit + 1, after)
+        cursor = next_cursor(stores, limit)
+        StoreModel.load_items(stores)
+
+        return {"stores": stores_schema.dump(stores), "next": cursor}, 200
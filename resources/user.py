@@ -5,7 +5,7 @@ from flask_restful import Resource
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt
 
 from libs.i18n import get_text
-from libs.bc import bc
+from libs.bc import hasher, HasherBusyException
 from libs.mg import MailgunException
 from schemas.user import UserSchema
 from models.user import UserModel
@@ -26,7 +26,10 @@ class UserRegister(Resource):
         if UserModel.find_by_email(user.email):
             return {"message": get_text("user_email_exists").format(user.email)}, 400
 
-        user.password = bc.generate_password_hash(user.password).decode('utf-8')
+        try:
+            user.password = hasher.generate_password_hash(user.password)
+        except HasherBusyException as err:
+            return {"message": str(err)}, 503, {"Retry-After": str(err.retry_after)}
 
         try:
             user.save_to_db()
@@ -71,9 +74,15 @@ class UserLogin(Resource):
 
         user = UserModel.find_by_username(user_data.username)
 
-        if user and user.verify_password(user_data.password):
-            activation = user.most_recent_activation
-            if activation and activation.activated:
+        try:
+            verified = user and user.verify_password(user_data.password)
+        except HasherBusyException as err:
+            return {"message": str(err)}, 503, {"Retry-After": str(err.retry_after)}
+
+        if verified:
+            user.rehash_password(user_data.password)
+
+            if user.is_activated:
                 access_token = create_access_token(
                     identity=user.id, fresh=True)
                 refresh_token = create_refresh_token(user.id)
@@ -89,9 +98,9 @@ class UserLogout(Resource):
     @jwt_required()
     def post(cls):
         # jti is "JWT ID", a unique identifier for a JWT.
-        jti = get_jwt()["jti"]
+        token = get_jwt()
         user_id = get_jwt_identity()
-        BLACKLIST.add(jti)
+        BLACKLIST.add(token["jti"], token.get("exp"))
         return {"message": get_text("user_logged_out").format(user_id)}, 200
 
 
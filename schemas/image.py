@@ -2,6 +2,8 @@ from marshmallow import Schema, fields
 from werkzeug.datastructures import FileStorage
 
 from libs.im import is_filename_safe
+from libs.ma import ma
+from models.image import ImageModel
 
 
 class FileStoragField(fields.Field):
@@ -19,3 +21,9 @@ class FileStoragField(fields.Field):
 
 class ImageSchema(Schema):
     image = FileStoragField(required=True)
+
+
+class ImageMetadataSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = ImageModel
+        dump_only = ("id", "filename", "size", "content_type", "hash", "width", "height", "created_at")
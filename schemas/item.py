@@ -1,12 +1,20 @@
 from libs.ma import ma
+from libs.fastdump import FastDumpMixin
 from models.item import ItemModel
 from models.store import StoreModel
 
 
-class ItemSchema(ma.SQLAlchemyAutoSchema):
+class ItemSchema(FastDumpMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = ItemModel
         dump_only = ("id",)
         load_only = ("store",)
         include_fk = True
         load_instance = True
+
+
+class ItemBulkSchema(ItemSchema):
+    """Loads plain dicts instead of instances, bulk loads write rows with bulk mappings"""
+
+    class Meta(ItemSchema.Meta):
+        load_instance = False
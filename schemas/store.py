@@ -1,13 +1,31 @@
+from typing import Iterable, List, Mapping, Sequence
+
 from libs.ma import ma
+from libs.fastdump import FastDumpMixin
 from models.store import StoreModel
 from schemas.item import ItemSchema
 
 
-class StoreSchema(ma.SQLAlchemyAutoSchema):
-    items = ma.Nested(ItemSchema, many=True)
+class StoreSchema(FastDumpMixin, ma.SQLAlchemyAutoSchema):
+    items = ma.Nested(ItemSchema, many=True, attribute="item_list", dump_only=True)
+
+    fast_dump_nested = ("items",)
 
     class Meta:
         model = StoreModel
         dump_only = ("id", "activated")
         include_fk = True
         load_instance = True
+
+    @property
+    def item_columns(self) -> list:
+        """The item columns to select for the `items` of `fast_dump`"""
+        return self.fields["items"].schema.fast_columns
+
+    def fast_dump(self, rows: Iterable[Sequence], items: Mapping[int, list] = None) -> List[dict]:
+        """Takes store rows and {store id: item rows selected with `item_columns`}, returns what `dump` would"""
+        item_schema = self.fields["items"].schema
+        stores = super().fast_dump(rows)
+        for store in stores:
+            store["items"] = item_schema.fast_dump((items or {}).get(store["id"], ()))
+        return stores
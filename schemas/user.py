@@ -7,7 +7,7 @@ from models.user import UserModel
 class UserSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = UserModel
-        dump_only = ("id", "activation")
+        dump_only = ("id", "activation", "avatar", "activated")
         load_only = ("password",)
         load_instance = True
 
@@ -0,0 +1,32 @@
+import pytest
+
+from app import create_app
+from libs.db import db
+from libs.schema import upgrade_schema
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "DEBUG": False,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "SQLALCHEMY_BINDS": {},
+        "UPLOADED_IMAGES_DEST": str(tmp_path / "images"),
+        "IMAGE_VARIANT_FOLDER": str(tmp_path / "variants"),
+        "EMAIL_OUTBOX_AUTOSTART": False,
+        "ACTIVATION_REAPER_AUTOSTART": False,
+    })
+    with app.app_context():
+        upgrade_schema()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,21 @@
+from time import time
+
+from blacklist import Blocklist
+
+
+def test_a_worker_sees_a_revocation_made_after_another_pruned_the_table(app):
+    with app.app_context():
+        worker_a, worker_b = Blocklist(), Blocklist()
+        for worker in (worker_a, worker_b):
+            worker.init_app(app)
+            worker.sync_interval = 0
+            worker._next_prune = float("inf")  # pruned below, when the test says so
+
+        worker_a.add("expired-1", int(time()) - 10)
+        worker_a.add("expired-2", int(time()) - 10)
+        assert "expired-2" in worker_b
+
+        # the rows with the highest ids are pruned, their ids must not come back
+        worker_a._prune()
+        worker_a.add("revoked", int(time()) + 3600)
+        assert "revoked" in worker_b
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from libs.bc import HasherBusyException, PasswordHasher
+
+
+def test_a_hashing_process_that_dies_is_replaced(app):
+    app.config.update(BCRYPT_LOG_ROUNDS=4, BCRYPT_MAX_WORKERS=1)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+
+    # what an OOM kill does to the process running the hash
+    with pytest.raises(HasherBusyException):
+        hasher._run(os._exit, 1)
+
+    assert hasher.check_password_hash(hasher.generate_password_hash("secret"), "secret")
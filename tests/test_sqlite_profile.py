@@ -0,0 +1,60 @@
+import sqlite3
+import threading
+
+from flask_jwt_extended import create_access_token
+
+from libs.db import db
+from models.item import ItemModel
+from models.store import StoreModel
+
+LOCK_HELD_FOR = 10  # seconds at most, released as soon as the read is over
+READ_TIMEOUT = 2
+
+
+def test_items_are_read_while_another_connection_holds_an_exclusive_transaction(app, client):
+    app.config["MODEL_CACHE_ENABLED"] = False
+    with app.app_context():
+        store = StoreModel(name="store")
+        db.session.add(store)
+        db.session.flush()
+        db.session.add(ItemModel(name="item", price=1.5, store_id=store.id))
+        db.session.commit()
+        database = db.get_engine(app).url.database
+        headers = {"Authorization": f"Bearer {create_access_token(identity=1)}"}
+
+    # the first request also prunes the token blocklist, a write, which is not what is checked
+    assert client.get("/api/v1/items", headers=headers).status_code == 200
+
+    locked, read_done = threading.Event(), threading.Event()
+    responses = []
+
+    def writer():
+        # another worker in the middle of a write, it only commits once the read is over
+        connection = sqlite3.connect(database, timeout=0)
+        try:
+            connection.execute("BEGIN EXCLUSIVE")
+            connection.execute("UPDATE items SET price = price + 1")
+            locked.set()
+            read_done.wait(LOCK_HELD_FOR)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def reader():
+        responses.append(client.get("/api/v1/items", headers=headers))
+
+    writing = threading.Thread(target=writer)
+    writing.start()
+    try:
+        assert locked.wait(READ_TIMEOUT)
+        reading = threading.Thread(target=reader, daemon=True)
+        reading.start()
+        reading.join(READ_TIMEOUT)
+        assert not reading.is_alive(), "the read waited for the writer's lock"
+    finally:
+        read_done.set()
+        writing.join()
+
+    assert responses[0].status_code == 200
+    # the read saw the last committed state, not the write in progress
+    assert [item["price"] for item in responses[0].get_json()["items"]] == [1.5]
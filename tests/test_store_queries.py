@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import event
+
+from libs.db import db
+from models.item import ItemModel
+from models.store import StoreModel
+
+ITEMS_PER_STORE = 3
+
+
+def add_stores(app, first: int, count: int) -> None:
+    with app.app_context():
+        for number in range(first, first + count):
+            store = StoreModel(name=f"store{number}")
+            db.session.add(store)
+            db.session.flush()
+            for item in range(ITEMS_PER_STORE):
+                db.session.add(ItemModel(name=f"item{number}-{item}", price=1.5, store_id=store.id))
+        db.session.commit()
+
+
+def count_statements(app, client, path: str) -> int:
+    """Returns how many SQL statements answering `path` ran"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.get_engine(app)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("fast_dump", [True, False])
+def test_store_list_runs_the_same_queries_whatever_the_number_of_stores(app, client, fast_dump):
+    app.config["SCHEMA_FAST_DUMP"] = fast_dump
+    path = "/api/v1/stores?limit=50"
+
+    add_stores(app, 0, 1)
+    client.get(path)  # first request setup is not what is measured
+    one_store = count_statements(app, client, path)
+
+    add_stores(app, 1, 19)
+    many_stores = count_statements(app, client, path)
+
+    stores = client.get(path).get_json()["stores"]
+    assert len(stores) == 20
+    assert all(len(store["items"]) == ITEMS_PER_STORE for store in stores)
+    assert many_stores == one_store